@@ -4,6 +4,8 @@ import argparse
 from typing import List
 import tqdm
 import sim.configuration
+import sim.experiment
+from sim.mining_schedule import generate_mining_schedule
 
 
 def setup_parser() -> argparse.ArgumentParser:
@@ -19,6 +21,8 @@ def setup_parser() -> argparse.ArgumentParser:
                         action='store_true', help="runs the code in parallel on slurm using sbatch")  # on/off flag
     parser.add_argument('--no_out',
                         action='store_true', help="runs the code in parallel on slurm using sbatch")  # on/off flag
+    parser.add_argument('--paired',
+                        action='store_true', help="runs both download rules and all bandwidths of a repetition on the same mining schedule")  # on/off flag
     return parser
 
 
@@ -59,17 +63,33 @@ num_repetitions = 300
 num_skipped = 0
 commands_to_run: List[str] = []
 
+SCHEDULE_PATH = os.path.join(DATA_PATH, "schedules/")
+if args.paired and not os.path.exists(SCHEDULE_PATH):
+    os.mkdir(SCHEDULE_PATH)
+schedule_config = sim.configuration.RunConfig(
+    run_time=4000, num_honest=100, honest_block_rate=0.01)
+
 for rep in range(num_repetitions):
+    schedule_arguments: List[str] = []
+    if args.paired:
+        # common random numbers: every run of this repetition mines the same blocks at the same times
+        schedule_file = os.path.join(SCHEDULE_PATH, f"schedule_{rep}.npz")
+        if not os.path.exists(schedule_file):
+            generate_mining_schedule(sim.experiment.mining_rates(
+                schedule_config), schedule_config.run_time).save(schedule_file)
+        schedule_arguments = [
+            f"--{sim.configuration.RunConfig.MINING_SCHEDULE} {schedule_file}"]
+
     for index, bandwidth in enumerate(bandwidth_range):
         file_name1 = os.path.join(
             DATA_PATH, "exp3_greedy_" + str(index)+"_"+str(rep)+".json")
-        arguments1 = base_arguments + [f"--{sim.configuration.RunConfig.BANDWIDTH} {bandwidth}",
+        arguments1 = base_arguments + schedule_arguments + [f"--{sim.configuration.RunConfig.BANDWIDTH} {bandwidth}",
                                        f"--{sim.configuration.RunConfig.SAVE_RESULTS} {file_name1}",
                                        f"--{sim.configuration.RunConfig.DOWNLOAD_RULE} {sim.configuration.DownloadRules.GreedyExtendChain.value}",]
 
         file_name2 = os.path.join(
             DATA_PATH, "exp3_longest_" + str(index)+"_"+str(rep)+".json")
-        arguments2 = base_arguments + [f"--{sim.configuration.RunConfig.BANDWIDTH} {bandwidth}",
+        arguments2 = base_arguments + schedule_arguments + [f"--{sim.configuration.RunConfig.BANDWIDTH} {bandwidth}",
                                        f"--{sim.configuration.RunConfig.SAVE_RESULTS} {file_name2}",
                                        f"--{sim.configuration.RunConfig.DOWNLOAD_RULE} {sim.configuration.DownloadRules.LongestHeaderChain.value}",]
 
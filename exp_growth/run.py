@@ -3,8 +3,12 @@ import numpy
 import os
 import argparse
 from sim.configuration import RunConfig
-from typing import List
+from sim.run_experiment import setup_parser as setup_run_parser
+from sim.run_batch import run_batch, assign_seeds
+from sim.lockstep import run_lockstep
+from typing import Dict, List
 import tqdm
+import json
 
 
 def setup_parser() -> argparse.ArgumentParser:
@@ -20,6 +24,10 @@ def setup_parser() -> argparse.ArgumentParser:
                         action='store_true', help="runs the code in parallel on slurm using sbatch")  # on/off flag
     parser.add_argument('--no_out',
                         action='store_true', help="runs the code in parallel on slurm using sbatch")  # on/off flag
+    parser.add_argument('--workers', default=os.cpu_count(), type=int,
+                        help="number of local worker processes (when not running on slurm)")
+    parser.add_argument('--lockstep',
+                        action='store_true', help="runs all repetitions of each point of the delay sweep together, with the vectorized lockstep engine (when not running on slurm)")  # on/off flag
     return parser
 
 
@@ -53,6 +61,10 @@ num_repetitions = 100
 
 num_skipped = 0
 commands_to_run: List[str] = []
+configs_to_run: List[RunConfig] = []
+# the delay sweep, by point, when it runs in lockstep:
+lockstep_configs: Dict[int, List[RunConfig]] = {}
+run_parser = setup_run_parser()
 
 for rep in range(num_repetitions):
     for index, bandwidth in enumerate(bandwidth_range):
@@ -76,12 +88,19 @@ for rep in range(num_repetitions):
             num_skipped += 1
         else:
             commands_to_run.append(cmd1)
+            configs_to_run.append(run_parser.parse_args(
+                ' '.join(arguments1).split(), namespace=RunConfig()))
 
         if os.path.exists(file_name2) and os.path.getsize(file_name2) > 0:
             print(f"SKIPPING {file_name2}")
             num_skipped += 1
+        elif args.lockstep and not args.slurm:
+            lockstep_configs.setdefault(index, []).append(run_parser.parse_args(
+                ' '.join(arguments2).split(), namespace=RunConfig()))
         else:
             commands_to_run.append(cmd2)
+            configs_to_run.append(run_parser.parse_args(
+                ' '.join(arguments2).split(), namespace=RunConfig()))
 
 if args.slurm:
     commands_to_run = [
@@ -90,8 +109,20 @@ if args.slurm:
         commands_to_run = [
             cmd + ' --output=/dev/null' for cmd in commands_to_run]
 
-for command in tqdm.tqdm(commands_to_run):
-    print(f"RUNNING: {command}")
-    os.system(command)
-
-print(f"\n\nskipped: {num_skipped}, ran: {len(commands_to_run)}.")
+    for command in tqdm.tqdm(commands_to_run):
+        print(f"RUNNING: {command}")
+        os.system(command)
+else:
+    # run locally in a pool of warm worker processes rather than one interpreter per run:
+    for result in tqdm.tqdm(run_batch(configs_to_run, args.workers), total=len(configs_to_run)):
+        if "error" in result:
+            print(f"FAILED: {result}")
+
+    for point_configs in tqdm.tqdm(lockstep_configs.values()):
+        assign_seeds(point_configs, None)
+        for run_cfg, result in zip(point_configs, run_lockstep(point_configs)):
+            with open(run_cfg.save_results, 'w') as out_file:
+                json.dump(result, out_file, indent=2)
+
+num_ran = len(commands_to_run) + sum(len(point_configs) for point_configs in lockstep_configs.values())
+print(f"\n\nskipped: {num_skipped}, ran: {num_ran}.")
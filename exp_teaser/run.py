@@ -5,6 +5,8 @@ import argparse
 from typing import List
 import tqdm
 import sim.configuration
+import sim.experiment
+from sim.mining_schedule import generate_mining_schedule
 
 
 def setup_parser() -> argparse.ArgumentParser:
@@ -20,6 +22,8 @@ def setup_parser() -> argparse.ArgumentParser:
                         action='store_true', help="runs the code in parallel on slurm using sbatch")  # on/off flag
     parser.add_argument('--no_out',
                         action='store_true', help="runs the code in parallel on slurm using sbatch")  # on/off flag
+    parser.add_argument('--paired',
+                        action='store_true', help="runs the attacker and no-attacker runs of a repetition on the same mining schedule")  # on/off flag
     parser.add_argument('--num_spv', nargs=1,
                         help="number of SPV nodes", required=False, type=int)
     return parser
@@ -58,17 +62,43 @@ num_repetitions = 100
 num_skipped = 0
 commands_to_run: List[str] = []
 
+SCHEDULE_PATH = os.path.join(DATA_PATH, "schedules/")
+if args.paired and not os.path.exists(SCHEDULE_PATH):
+    os.mkdir(SCHEDULE_PATH)
+schedule_config = sim.configuration.RunConfig(
+    run_time=1000, num_honest=100, honest_block_rate=0.01, teasing_attacker=1.0, num_spv=args.num_spv[0])
+
 for rep in range(num_repetitions):
+    schedule_arguments1: List[str] = []
+    schedule_arguments2: List[str] = []
+    if args.paired:
+        # common random numbers: the no-attacker run mines the honest blocks of the attacker run (the attacker and SPV blocks are dropped)
+        schedule_file2 = os.path.join(
+            SCHEDULE_PATH, f"schedule_teaser_{rep}.npz")
+        schedule_file1 = os.path.join(
+            SCHEDULE_PATH, f"schedule_band_{rep}.npz")
+        if not os.path.exists(schedule_file2) or not os.path.exists(schedule_file1):
+            schedule = generate_mining_schedule(sim.experiment.mining_rates(
+                schedule_config), schedule_config.run_time)
+            schedule.save(schedule_file2)
+            num_honest = schedule_config.num_honest
+            schedule.without_miners(
+                [0] + list(range(1 + num_honest, 1 + num_honest + args.num_spv[0]))).save(schedule_file1)
+        schedule_arguments1 = [
+            f"--{sim.configuration.RunConfig.MINING_SCHEDULE} {schedule_file1}"]
+        schedule_arguments2 = [
+            f"--{sim.configuration.RunConfig.MINING_SCHEDULE} {schedule_file2}"]
+
     for index, bandwidth in enumerate(bandwidth_range):
         file_name1 = os.path.join(
             DATA_PATH, "exp2_band_" + str(index)+"_"+str(rep)+".json")
-        arguments1 = base_arguments + \
+        arguments1 = base_arguments + schedule_arguments1 + \
             [f"--{sim.configuration.RunConfig.BANDWIDTH} {bandwidth}",
              f"--{sim.configuration.RunConfig.SAVE_RESULTS} {file_name1}"]
 
         file_name2 = os.path.join(
             DATA_PATH, "exp2_teaser_" + str(index)+"_"+str(rep)+".json")
-        arguments2 = base_arguments + \
+        arguments2 = base_arguments + schedule_arguments2 + \
             [f"--{sim.configuration.RunConfig.BANDWIDTH} {bandwidth}",
              f"--{sim.configuration.RunConfig.SAVE_RESULTS} {file_name2}",
              f"--{sim.configuration.RunConfig.TEASING_ATTACKER} 1.0",
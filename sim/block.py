@@ -1,43 +1,120 @@
-from typing import List, Optional, ClassVar, TYPE_CHECKING
+from typing import List, Optional, Protocol, TYPE_CHECKING
 if TYPE_CHECKING:
-    from .node import Node
+    from .context import SimulationContext
+
+
+class Miner(Protocol):
+    """what a block knows of its miner: a Node, or a member of a NodePopulation"""
+    @property
+    def id(self) -> int: ...
 
 
 class Block:
-    all_blocks: ClassVar[List["Block"]] = []
-    blocks_by_height: ClassVar[List[int]] = []
+    """Blocks are compared and hashed by identity. The id is a dense integer (the order in which blocks are linked into the tree,
+    see EquivocatedCopies), and the label "h.k" (the k-th block created at height h) is only formatted when it is needed.
 
-    def __init__(self, miner: Optional["Node"], parent: Optional["Block"], creation_time: float):
-        Block.all_blocks.append(self)
+    Besides its parent, every block keeps a skip pointer to one of its ancestors (the scheme of Bitcoin's CBlockIndex::pskip),
+    so ancestor and common ancestor queries take O(log h) steps instead of walking the chain one block at a time.
 
+    Blocks that are withheld (unavailable) can be released later, but an available block stays available.
+    Every unavailable block tracks the highest available block that hangs below it through available blocks only
+    (see available_descendant_height). Available blocks point towards the nearest unavailable ancestor, 
+    and a released block merges into the block above it, as in a union-find structure.
+
+    Copies of a chain (see EquivocatedCopies) are blocks that are not linked into the tree until they are materialized."""
+    __slots__ = ("__id", "__parent", "__skip", "__children", "__is_available", "__creation_time", "__miner",
+                 "__height", "__index_at_height", "__is_final", "__anchor", "__available_descendant_height", "__copies")
+
+    def __init__(self, miner: Optional[Miner], parent: Optional["Block"], creation_time: float, context: "SimulationContext",
+                 is_available: bool = True):
+        if parent is not None:
+            parent.materialize()
         self.__parent = parent
-        self.__children: List["Block"] = []
-        self.__is_available = True
+        self.__is_available = is_available
         self.__creation_time = creation_time
         self.__miner = miner
-        self.__round = round
+        self.__is_final = False
+        self.__height: int = parent.__height + 1 if parent else 0
+        self.__copies: Optional["EquivocatedCopies"] = None
+        self.__link(context)
+
+    def __link(self, context: "SimulationContext") -> None:
+        """gives the block its id and label, and links it into the tree (children, skip pointer and availability)"""
+        self.__id = context.allocate_block_id()
+        context.all_blocks.append(self)
+
+        parent = self.__parent
+        self.__children: List["Block"] = []
+        self.__skip: Optional["Block"] = None
         if parent:
             parent.__children.append(self)
-            self.__height: int = parent.__height+1
-        else:
-            self.__height = 0
+            skip = parent.ancestor(_skip_height(self.__height))
+            # (the skip target is unreachable if it was released by pruning)
+            if skip.__height == _skip_height(self.__height):
+                self.__skip = skip
 
-        if self.__height >= len(Block.blocks_by_height):
-            Block.blocks_by_height.append(1)
+        self.__anchor: Optional["Block"] = None
+        self.__available_descendant_height = -1
+        if self.__is_available and parent:
+            self.__anchor = parent if not parent.__is_available else parent.__nearest_unavailable_ancestor()
+            if self.__anchor is not None:
+                self.__anchor.__available_descendant_height = max(
+                    self.__anchor.__available_descendant_height, self.__height)
+
+        blocks_by_height = context.blocks_by_height
+        if self.__height >= len(blocks_by_height):
+            blocks_by_height.append(1)
         else:
-            Block.blocks_by_height[self.__height] += 1
+            blocks_by_height[self.__height] += 1
+        self.__index_at_height = blocks_by_height[self.__height]
+
+    @staticmethod
+    def copy_chain(miner: Optional[Miner], base: "Block", num_copies: int, num_available: int, creation_time: float,
+                   context: "SimulationContext") -> List["Block"]:
+        """num_copies blocks on top of the base, of which the lowest num_available are available (see EquivocatedCopies)"""
+        copies = EquivocatedCopies(base, context)
+        parent = base
+        for index in range(num_copies):
+            block = Block.__new__(Block)
+            block.__id = -1
+            block.__parent = parent
+            block.__is_available = index < num_available
+            block.__creation_time = creation_time
+            block.__miner = miner
+            block.__is_final = False
+            block.__height = parent.__height + 1
+            block.__copies = copies
+            block.__children = []
+            block.__skip = None
+            block.__available_descendant_height = -1
+            copies.blocks.append(block)
+            parent = block
+        return copies.blocks
 
-        self.__id = f"{self.__height}.{Block.blocks_by_height[self.__height]}"
-        self.__hash = hash(self.__id)
+    @property
+    def is_materialized(self) -> bool:
+        return self.__copies is None
 
-        self.__description = f"Block(id={self.id}, h={self.height}, parent_id={self.parent.id if self.parent else None}, creation_time={self.__creation_time})"
+    def materialize(self) -> None:
+        """links a copy that is not materialized yet into the tree, after its copied ancestors"""
+        if self.__copies is None:
+            return
+        context = self.__copies.context
+        pending = []
+        block: Block = self
+        while block.__copies is not None:
+            pending.append(block)
+            block = block.__parent  # type: ignore
+        for block in reversed(pending):
+            block.__copies = None
+            block.__link(context)
 
     @property
     def creation_time(self) -> float:
         return self.__creation_time
 
     @property
-    def miner(self) -> Optional["Node"]:
+    def miner(self) -> Optional[Miner]:
         return self.__miner
 
     @property
@@ -46,7 +123,37 @@ class Block:
 
     @is_available.setter
     def is_available(self, available: bool) -> None:
-        self.__is_available = available
+        if available == self.__is_available:
+            return
+        if not available:
+            raise ValueError(f"an available block cannot be withheld: {self}")
+        self.materialize()
+        self.__is_available = True
+        parent = self.__parent
+        if parent is not None:
+            self.__anchor = parent if not parent.__is_available else parent.__nearest_unavailable_ancestor()
+            if self.__anchor is not None:
+                self.__anchor.__available_descendant_height = max(
+                    self.__anchor.__available_descendant_height, self.__height, self.__available_descendant_height)
+
+    @property
+    def available_descendant_height(self) -> int:
+        """the height of the highest available block that can be reached from this (unavailable) block 
+        by going down through available blocks only, or -1 if there is none"""
+        if self.__is_available:
+            raise ValueError(f"only tracked for unavailable blocks: {self}")
+        return self.__available_descendant_height
+
+    def __nearest_unavailable_ancestor(self) -> Optional["Block"]:
+        """for an available block: the nearest unavailable ancestor such that all blocks in between are available (or None)"""
+        root = self.__anchor
+        while root is not None and root.__is_available:
+            root = root.__anchor
+        # path compression (the anchors lead to the root, so the walk stops before it reaches None):
+        block: Optional[Block] = self
+        while block is not None and block.__anchor is not root:
+            block.__anchor, block = root, block.__anchor
+        return root
 
     @property
     def height(self) -> int:
@@ -57,19 +164,126 @@ class Block:
         return self.__parent
 
     @property
-    def id(self) -> str:
+    def skip(self) -> Optional["Block"]:
+        """an ancestor further down the chain (at _skip_height(height)), or None"""
+        return self.__skip
+
+    @property
+    def id(self) -> int:
         return self.__id
 
+    @property
+    def label(self) -> str:
+        if self.__copies is not None:
+            # (copies are numbered when they are materialized)
+            return f"{self.__height}.copy"
+        return f"{self.__height}.{self.__index_at_height}"
+
+    @property
+    def is_final(self) -> bool:
+        """final blocks are the ancestors of the pruning watermark. They are all on one chain, 
+        and their parents and children are released (see SimulationContext.prune)"""
+        return self.__is_final
+
+    def finalize(self) -> None:
+        self.__is_final = True
+        self.__parent = None
+        self.__skip = None
+        self.__children = []
+
+    def ancestor(self, height: int) -> "Block":
+        """the ancestor of this block at the given height (the block itself if it is not higher).
+        Final blocks have no parents, so if the walk reaches a final block above the given height, it stops there and returns it."""
+        block = self
+        copies = self.__copies
+        if copies is not None and height < self.__height:
+            # (copies that are not materialized have no skip pointers, but the ones of a chain are listed by height)
+            base = copies.base
+            if height > base.__height:
+                return copies.blocks[height - base.__height - 1]
+            block = base
+        while block.__height > height:
+            skip = block.__skip
+            if skip is not None:
+                skip_height = skip.__height
+                if skip_height == height:
+                    return skip
+                # take the skip pointer unless it overshoots, or the parent's skip pointer gets closer to the target:
+                if skip_height > height:
+                    prev_skip_height = _skip_height(block.__height - 1)
+                    if not (prev_skip_height < skip_height - 2 and prev_skip_height >= height):
+                        block = skip
+                        continue
+            if block.__parent is None:
+                break
+            block = block.__parent
+        return block
+
     def get_children(self) -> List["Block"]:
         return self.__children[:]
 
-    def __hash__(self) -> int:
-        return self.__hash
-
     def __str__(self) -> str:
-        return self.__description
-    
-    def __eq__(self, other: "Block") -> bool:
-        if self is None or other is None:
-            return False
-        return self.__id == other.id
\ No newline at end of file
+        return f"Block(id={self.label}, h={self.height}, parent_id={self.parent.label if self.parent else None}, creation_time={self.__creation_time})"
+
+
+class EquivocatedCopies:
+    """A chain of copies that a miner announces at once (see EquivocationTeasingPoWAttacker): lightweight blocks that share
+    the miner and creation time of the chain and know only their parent, height and availability (their id is -1). A copy becomes
+    a real block of the tree (with an id, a label, and links from its parent and skip pointer) only when it is materialized: when a node
+    starts downloading it or builds on it. The copies that no node downloads are never linked, and are dropped with the headers
+    that refer to them."""
+
+    def __init__(self, base: Block, context: "SimulationContext") -> None:
+        self.base = base
+        self.context = context
+        self.blocks: List[Block] = []
+
+
+def _skip_height(height: int) -> int:
+    """the height that the skip pointer of a block at the given height points to.
+    Any ancestor can be reached with O(log h) skips, and the skip targets of nearby heights are spread out."""
+    if height < 2:
+        return 0
+    if height & 1:
+        return _clear_lowest_bit(_clear_lowest_bit(height - 1)) + 1
+    return _clear_lowest_bit(height)
+
+
+def _clear_lowest_bit(n: int) -> int:
+    return n & (n - 1)
+
+
+def common_ancestor(block1: Block, block2: Block) -> Block:
+    """the lowest common ancestor of two blocks. Final blocks have no parents, but they are all ancestors of one another, 
+    so the common ancestor of two final blocks is the lower one."""
+    if block1.height > block2.height:
+        block1, block2 = block2, block1
+    block2 = block2.ancestor(block1.height)
+
+    while block1 is not block2:
+        if block1.is_final or block2.is_final or block1.height != block2.height:
+            # the walk reached the final chain, so the common ancestor is final:
+            return _lower(_highest_final_ancestor(block1), _highest_final_ancestor(block2))
+        # both blocks are at the same height, so their skip pointers are at the same height too:
+        skip1, skip2 = block1.skip, block2.skip
+        if skip1 is not None and skip2 is not None and skip1 is not skip2:
+            block1, block2 = skip1, skip2
+        else:
+            assert block1.parent is not None and block2.parent is not None
+            block1, block2 = block1.parent, block2.parent
+    return block1
+
+
+def _highest_final_ancestor(block: Block) -> Block:
+    while not block.is_final:
+        skip = block.skip
+        if skip is not None and not skip.is_final:
+            block = skip
+        else:
+            assert block.parent is not None
+            block = block.parent
+    return block
+
+
+def _lower(block1: Block, block2: Block) -> Block:
+    return block1 if block1.height < block2.height else block2
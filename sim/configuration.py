@@ -8,6 +8,11 @@ class DownloadRules(Enum):
     GreedyExtendChain = "greedy_extend_chain"
 
 
+class EventEngines(Enum):
+    Simpy = "simpy"
+    Heap = "heap"
+
+
 @dataclasses.dataclass
 class RunConfig:
     MODE: ClassVar[str] = "mode"
@@ -34,9 +39,15 @@ class RunConfig:
     HEADER_DELAY: ClassVar[str] = "header_delay"
     header_delay: float = 0
 
+    TOPOLOGY: ClassVar[str] = "topology"
+    topology: str = ""
+
     INDUCE_SPLIT: ClassVar[str] = "induce_split"
     induce_split: Optional[Tuple[float, float]] = None
 
+    PARTITION_SCHEDULE: ClassVar[str] = "partition_schedule"
+    partition_schedule: str = ""
+
     DUMB_ATTACKER: ClassVar[str] = "dumb_attacker"
     dumb_attacker: float = 0
 
@@ -55,6 +66,27 @@ class RunConfig:
     DOWNLOAD_RULE: ClassVar[str] = "download_rule"
     download_rule: str = DownloadRules.LongestHeaderChain.value
 
+    SEED: ClassVar[str] = "seed"
+    seed: Optional[int] = None
+
+    PRUNE_INTERVAL: ClassVar[str] = "prune_interval"
+    prune_interval: float = 0
+
+    MINING_SCHEDULE: ClassVar[str] = "mining_schedule"
+    mining_schedule: str = ""
+
+    NODE_POPULATION: ClassVar[str] = "node_population"
+    node_population: bool = False
+
+    SYMMETRY_REDUCTION: ClassVar[str] = "symmetry_reduction"
+    symmetry_reduction: bool = False
+
+    PARALLEL_WORKERS: ClassVar[str] = "parallel_workers"
+    parallel_workers: int = 0
+
+    ENGINE: ClassVar[str] = "engine"
+    engine: str = EventEngines.Simpy.value
+
     PLOT: ClassVar[str] = "plot"
     plot: Optional[Tuple[float, float]] = None
 
@@ -0,0 +1,77 @@
+from typing import List, Optional, TYPE_CHECKING
+from .engine import EventEngine
+import logging
+import numpy.random
+if TYPE_CHECKING:
+    from .block import Block
+
+
+class SimulationContext:
+    """The state shared by all blocks and nodes of a single experiment. 
+    Keeping it here (rather than in class variables) allows many experiments to run one after the other in the same process."""
+
+    def __init__(self, env: EventEngine, seed: Optional[int] = None) -> None:
+        self.env = env
+        self.all_blocks: List["Block"] = []
+        self.blocks_by_height: List[int] = []
+        self.__next_node_id = 0
+        self.__next_block_id = 0
+        self.__watermark: Optional["Block"] = None
+        # without a seed, fresh entropy is drawn from the OS (and can be read back through the seed property).
+        self.__seed_sequence = numpy.random.SeedSequence(seed)
+
+        # resolved once, so that the nodes do not format log messages that nobody reads:
+        self.log_events = is_logging(logging.getLogger("SIM_INFO"))
+        self.log_blocks = is_logging(logging.getLogger("BLOCK_LOG"))
+
+    @property
+    def seed(self) -> int:
+        return self.__seed_sequence.entropy  # type: ignore
+
+    def spawn_rng(self) -> numpy.random.Generator:
+        """returns a random generator with a stream that is independent of all other generators of this experiment.
+        Generators are spawned deterministically, in the order in which they are requested."""
+        child, = self.__seed_sequence.spawn(1)
+        return numpy.random.default_rng(child)
+
+    def allocate_node_id(self) -> int:
+        node_id = self.__next_node_id
+        self.__next_node_id += 1
+        return node_id
+
+    def allocate_block_id(self) -> int:
+        block_id = self.__next_block_id
+        self.__next_block_id += 1
+        return block_id
+
+    @property
+    def watermark(self) -> Optional["Block"]:
+        return self.__watermark
+
+    def prune(self, watermark: "Block") -> List["Block"]:
+        """releases the block tree below the watermark, a common ancestor of every block that any node may still build on.
+        The ancestors of the watermark become final: they drop their parent and children, so the side branches that fork below 
+        the watermark are detached from the tree, and the blocks below it are removed from all_blocks.
+
+        returns the newly final blocks that no side branch forks from. Nothing walks back to them anymore, 
+        so the nodes can forget them (see Node.release_final_blocks)."""
+        if self.__watermark is not None and watermark.height <= self.__watermark.height:
+            return []
+        self.__watermark = watermark
+
+        released = []
+        block = watermark.parent
+        while block is not None and not block.is_final:
+            parent = block.parent
+            if len(block.get_children()) <= 1:
+                released.append(block)
+            block.finalize()
+            block = parent
+
+        self.all_blocks = [
+            block for block in self.all_blocks if block.height >= watermark.height]
+        return released
+
+
+def is_logging(logger: logging.Logger) -> bool:
+    return logger.isEnabledFor(logging.INFO) and logger.hasHandlers()
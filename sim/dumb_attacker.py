@@ -2,6 +2,7 @@
 from .block import Block
 from .node import Node
 import sim.network as network
+from typing import List
 
 
 class DumbAttacker(Node):
@@ -21,6 +22,9 @@ class DumbAttacker(Node):
         super().receive_header(block)
         self._mining_target = self._tip
 
+    def retained_blocks(self) -> List[Block]:
+        return [self._mining_target, self._tip]
+
     def download_complete(self, block: Block) -> None:
         super().download_complete(block)
         self._mining_target = self._tip
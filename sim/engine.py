@@ -0,0 +1,112 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Deque, List, Tuple
+import collections
+import heapq
+import simpy.core
+import simpy.events
+
+
+class EventEngine(ABC):
+    """The discrete event core that drives the simulation.
+    Callbacks scheduled for the same time are executed in the order in which they were scheduled."""
+
+    @property
+    @abstractmethod
+    def now(self) -> float:
+        pass
+
+    @abstractmethod
+    def schedule(self, delay: float, callback: Callable[[], None]) -> None:
+        """schedules the callback to be called after the given delay"""
+        pass
+
+    def schedule_now(self, callback: Callable[[], None]) -> None:
+        """schedules the callback for the current time, after everything that is already scheduled for it"""
+        self.schedule(0, callback)
+
+    def schedule_at(self, time: float, callback: Callable[[], None]) -> None:
+        """schedules the callback for the given time (not before the current time).
+        The time is reached as the current time plus a delay, which may round it unless the engine overrides this."""
+        self.schedule(time - self.now, callback)
+
+    @abstractmethod
+    def run(self, until: float) -> None:
+        """executes all callbacks scheduled strictly before the given time, and advances the clock to it"""
+        pass
+
+
+class SimpyEngine(EventEngine):
+    def __init__(self) -> None:
+        self.__env = simpy.core.Environment()
+
+    @property
+    def now(self) -> float:
+        return self.__env.now
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> None:
+        def call(_: simpy.events.Event) -> None:
+            callback()
+        self.__env.timeout(delay).callbacks.append(call)
+
+    def run(self, until: float) -> None:
+        self.__env.run(until=until)
+
+
+class HeapEngine(EventEngine):
+    """A lean event engine: a binary heap of (time, seq, callback) entries.
+    Cancellation is lazy: the owner of a callback marks it dead and the callback ignores the call once it is popped.
+
+    Callbacks for the current time (zero delay downloads and announcements) skip the heap and wait in a fifo.
+    Whatever the heap holds for the current time was scheduled earlier, so it runs first and the order is unchanged."""
+
+    def __init__(self) -> None:
+        self.__now: float = 0
+        self.__seq = 0
+        self.__queue: List[Tuple[float, int, Callable[[], None]]] = []
+        self.__now_queue: Deque[Callable[[], None]] = collections.deque()
+
+    @property
+    def now(self) -> float:
+        return self.__now
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> None:
+        if delay < 0:
+            raise ValueError(f"negative delay {delay}")
+        time = self.__now + delay
+        if time == self.__now:
+            self.__now_queue.append(callback)
+            return
+        self.__seq += 1
+        heapq.heappush(self.__queue, (time, self.__seq, callback))
+
+    def schedule_now(self, callback: Callable[[], None]) -> None:
+        self.__now_queue.append(callback)
+
+    def schedule_at(self, time: float, callback: Callable[[], None]) -> None:
+        if time < self.__now:
+            raise ValueError(
+                f"time ({time}) is before the current time ({self.__now})")
+        if time == self.__now:
+            self.__now_queue.append(callback)
+            return
+        self.__seq += 1
+        heapq.heappush(self.__queue, (time, self.__seq, callback))
+
+    def run(self, until: float) -> None:
+        if until < self.__now:
+            raise ValueError(
+                f"until ({until}) must be greater than the current time ({self.__now})")
+        queue = self.__queue
+        now_queue = self.__now_queue
+        heappop = heapq.heappop
+        while self.__now < until:
+            if queue and queue[0][0] == self.__now:
+                callback = heappop(queue)[2]
+            elif now_queue:
+                callback = now_queue.popleft()
+            elif queue and queue[0][0] < until:
+                self.__now, _, callback = heappop(queue)
+            else:
+                break
+            callback()
+        self.__now = until
@@ -2,6 +2,7 @@
 from .block import Block
 from .node import Node
 import sim.network as network
+from typing import List
 
 
 class EquivocationTeasingPoWAttacker(Node):
@@ -10,6 +11,8 @@ class EquivocationTeasingPoWAttacker(Node):
     thus, a node that downloads towards the longest tip always first downloads *equivocating* block of this attacker
     up to the height matching the new honest block."""
 
+    _withholds_blocks = True
+
     def __init__(self, genesis: Block, mining_rate: float, network: network.Network) -> None:
         super().__init__(genesis, mining_rate, bandwidth=0, header_delay=0, network=network)
         self._tip = genesis
@@ -20,7 +23,6 @@ class EquivocationTeasingPoWAttacker(Node):
 
     def mine_block(self) -> Block:
         block = super().mine_block()
-        block.is_available = False
 
         self._mining_target = block
         self._tip = block
@@ -49,39 +51,35 @@ class EquivocationTeasingPoWAttacker(Node):
         # if self._num_interventions == 20:
         #     print("Blocktree:")
         #     print("digraph G {")
-        #     for block in Block.all_blocks:
+        #     for block in self._context.all_blocks:
         #         print(
-        #             f"  blk_{block.id.replace('.', '_')} [label=\"{block.id} of {block.miner.id if block.miner else None} at {round(block.creation_time, 2)} is {block.is_available}\"]")
+        #             f"  blk_{block.id} [label=\"{block.label} of {block.miner.id if block.miner else None} at {round(block.creation_time, 2)} is {block.is_available}\"]")
         #         if block.parent:
         #             print(
-        #                 f"  blk_{block.id.replace('.', '_')} -> blk_{block.parent.id.replace('.', '_')}")
+        #                 f"  blk_{block.id} -> blk_{block.parent.id}")
         #     print("}")
         #     exit(0)
 
     def _duplicate_and_announce_adversarial_chain_to_height(self, blk, target_height) -> Block:
-        while blk.height > target_height:
-            blk = blk.parent
+        blk = blk.ancestor(target_height)
 
-        blks_to_dup = []
+        # the private chain is copied from the block it was mined on up to target_height:
         while blk.miner == self:
-            blks_to_dup.append(blk)
             blk = blk.parent
-
-        blk_parent = blk
-        while len(blks_to_dup) > 0:
-            blk_to_dup = blks_to_dup.pop()
-            blk_new = Block(self, blk_parent,
-                            EquivocationTeasingPoWAttacker.env.now)
-            blk_parent = blk_new
-
-            if blk_new.height < target_height - 1:
-                blk_new.is_available = True
-                self._broadcast_header(blk_new)
-            elif blk_new.height <= target_height:
-                blk_new.is_available = False
-                self._broadcast_header(blk_new)
-
-        return blk_parent
+        num_copies = target_height - blk.height
+
+        # the copies are lightweight until a node downloads them (see EquivocatedCopies). The two highest of them are withheld,
+        # and all are announced together, as one batch of headers:
+        copies = Block.copy_chain(self, blk, num_copies, num_copies - 2, self._env.now, self._context)
+        self._broadcast_headers(copies)
+        return copies[-1] if copies else blk
+
+    def retained_blocks(self) -> List[Block]:
+        # duplication walks back from the tip to the block the private chain was mined on:
+        base = self._tip
+        while base.miner == self and base.parent is not None:
+            base = base.parent
+        return [self._mining_target, self._tip, base]
 
     def download_complete(self, block: Block) -> None:
         super().download_complete(block)
@@ -1,9 +1,9 @@
 
 import dataclasses
-from typing import List, Generator, Optional, Tuple, Any, Dict, Union
+from typing import List, Optional, Sequence, Tuple, Any, Dict, Union
 
 import tqdm
-import simpy
+import json
 import os
 
 from .honest_node_longest_header_chain import HonestNodeLongestHeaderChain
@@ -12,47 +12,80 @@ from .spv_node import SPVNode
 from .dumb_attacker import DumbAttacker
 from .private_attacker import PrivateAttacker
 from .node import Node
+from .node_population import NodePopulation, PopulationNode, check_population_config
 from .mining_oracle import PoWMiningOracle  # , PoSMiningOracle
-from .network import Network
-from .block import Block
+from .mining_schedule import MiningSchedule
+from .network import Network, partition_labels
+from .topology import Topology, create_topology
+from .engine import EventEngine, SimpyEngine, HeapEngine
+from .context import SimulationContext
+from .block import Block, common_ancestor
 from .teasing_pow_attacker import TeasingPoWAttacker
 from .equivocation_teasing_pow_attacker import EquivocationTeasingPoWAttacker
-from .configuration import RunConfig, DownloadRules
+from .configuration import RunConfig, DownloadRules, EventEngines
 
 
 BASE_PATH = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
 
 
 class Experiment:
-    def __init__(self, run_config: RunConfig) -> None:
+    def __init__(self, run_config: RunConfig, mining_schedule: Optional[MiningSchedule] = None) -> None:
         self.__config = run_config
-        self.__env = simpy.core.Environment()
-        # pass the environment to the nodes for logging purposes.
-        Node.env = self.__env
+        self.__env = create_engine(run_config.engine)
+        # all the state of this run (blocks, node ids, the event engine) lives in its context:
+        self.__context = SimulationContext(self.__env, run_config.seed)
 
         self.__download_log: Optional[Dict[Node,
                                            List[Tuple[Block, float, float]]]] = None
         if self.__config.plot:
             self.__download_log = {}
 
-        self.__network = Network(self.__env, self.__download_log)
-        self.__all_nodes: List[Node] = []
-        self.__honest_nodes: List[Node]
+        # a random graph is drawn before the blocks, so a run with a random topology mines other blocks than one without it
+        # (unless both follow a mining schedule):
+        topology: Optional[Topology] = None
+        if run_config.topology:
+            topology = create_topology(run_config.topology, len(mining_rates(run_config)), run_config.header_delay,
+                                       self.__context.spawn_rng)
+        self.__network = Network(
+            self.__context, self.__download_log, topology)
+        self.__all_nodes: List[Union[Node, PopulationNode]] = []
+        self.__honest_nodes: Sequence[Union[Node, PopulationNode]]
         self.__spv_nodes: List[Node] = []
 
-        self.__genesis = Block(None, None, 0)
+        self.__genesis = Block(None, None, 0, self.__context)
 
         self._create_all_nodes()
 
+        if mining_schedule is None and run_config.mining_schedule:
+            mining_schedule = MiningSchedule.load(run_config.mining_schedule)
+        if mining_schedule is not None:
+            check_mining_schedule(mining_schedule, run_config)
+
         if run_config.mode == "pow":
             self.__mining_oracle = PoWMiningOracle(
-                self.__env, self.__all_nodes)
+                self.__env, self.__all_nodes, self.__context.spawn_rng(), self.__context.spawn_rng(),
+                schedule=mining_schedule)
         else:
             # self.__mining_oracle = PoSMiningOracle(self.__env,
             #                                        self.__all_nodes, run_config.pos_round_length, run_config.attacker_head_start)
             raise NotImplementedError("PoS is not fully implemented.")
         self.__run_time = run_config.run_time
 
+        if run_config.prune_interval > 0:
+            if run_config.plot:
+                raise ValueError(
+                    "Pruning releases the blocks that the plot needs, do not use both")
+            self.__env.schedule(run_config.prune_interval, self._prune)
+
+        # the network is split and healed by events (headers that were sent before a change still arrive):
+        for time, assignment in partition_schedule(run_config):
+            labels = partition_labels(assignment, len(self.__all_nodes))
+            if labels is not None and len(labels) != len(self.__all_nodes):
+                raise ValueError(
+                    f"The partition at time {time} has {len(labels)} labels, but there are {len(self.__all_nodes)} nodes")
+            self.__env.schedule(
+                time, lambda labels=labels: self.__network.set_partition(labels))  # type: ignore
+
     def _create_all_nodes(self) -> None:
         if self.__config.dumb_attacker:
             attacker = DumbAttacker(
@@ -84,6 +117,15 @@ class Experiment:
             for i in range(self.__config.attacker_head_start):
                 attacker4.mine_block()
 
+        if self.__config.node_population or self.__config.symmetry_reduction:
+            check_population_config(self.__config)
+            population = NodePopulation(self.__genesis, self.__config.num_honest, self.__config.honest_block_rate,
+                                        self.__config.bandwidth, self.__config.header_delay, self.__context,
+                                        merge_classes=self.__config.symmetry_reduction)
+            self.__honest_nodes = population.members
+            self.__all_nodes += self.__honest_nodes
+            return
+
         if self.__config.download_rule == DownloadRules.LongestHeaderChain.value:
             def node_factory() -> Node:
                 return HonestNodeLongestHeaderChain(self.__genesis, self.__config.honest_block_rate, self.__config.bandwidth,
@@ -109,37 +151,49 @@ class Experiment:
         if progress_bar:
             self.setup_progress_bar()
 
-        if self.__config.induce_split is not None:
-            split_start, split_end = self.__config.induce_split
-            if split_start < self.__run_time and split_end > split_start:
-                self.__env.run(until=split_start)
-                mid = len(self.__all_nodes)//2
-                self.__network.induce_split(set(self.__all_nodes[:mid]))
-            if split_end < self.__run_time:
-                self.__env.run(until=split_end)
-                self.__network.end_split()
-
         self.__env.run(until=self.__run_time)
 
         if self.__config.plot is not None:
             assert self.__download_log is not None
             plot_timeline(
                 start_time=self.__config.plot[0], end_time=self.__config.plot[1],
-                num_nodes=len(self.__all_nodes), download_log=self.__download_log)
+                num_nodes=len(self.__all_nodes), download_log=self.__download_log,
+                all_blocks=self.__context.all_blocks)
+
+    def _prune(self) -> None:
+        # most nodes retain the same few blocks, so the common ancestor is computed over the distinct ones:
+        # (blocks are hashed by identity, copies that are not materialized have no id yet):
+        retained_blocks = list(dict.fromkeys(
+            block for node in self.__all_nodes for block in node.retained_blocks()))
+        watermark = retained_blocks[0]
+        for block in retained_blocks:
+            watermark = common_ancestor(watermark, block)
+        released = self.__context.prune(watermark)
+        for node in self.__all_nodes:
+            node.release_final_blocks(released)
+        self.__env.schedule(self.__config.prune_interval, self._prune)
 
     def setup_progress_bar(self, num_updates: int = 100) -> None:
-        def progress_bar_process() -> Generator[simpy.events.Event, None, None]:
-            with tqdm.tqdm(total=self.__run_time, disable=None, unit="sim_secs") as pbar:
-                for i in range(num_updates):
-                    yield self.__env.timeout(self.__run_time/num_updates)
-                    pbar.update(self.__run_time/num_updates)
-        self.__env.process(progress_bar_process())
+        pbar = tqdm.tqdm(total=self.__run_time,
+                         disable=None, unit="sim_secs")
+        update_interval = self.__run_time/num_updates
+
+        def update_progress_bar(updates_left: int) -> None:
+            pbar.update(update_interval)
+            if updates_left > 1:
+                self.__env.schedule(
+                    update_interval, lambda: update_progress_bar(updates_left-1))
+            else:
+                pbar.close()
+        self.__env.schedule(
+            update_interval, lambda: update_progress_bar(num_updates))
 
     def get_results(self) -> Dict[str, Any]:
         honest_chain_height = self.calc_honest_chain_height()
 
         result: Dict[str, Any] = {}
         result["config"] = dataclasses.asdict(self.__config)
+        result["seed"] = self.__context.seed
         result["honest_chain_height"] = honest_chain_height
         result["honest_chain_common_ancestor_height"] = self.get_common_ancestor_height()
         return result
@@ -150,21 +204,59 @@ class Experiment:
     def get_common_ancestor_height(self) -> int:
         ancestor = self.__honest_nodes[0].mining_target
         for node in self.__honest_nodes:
-            block = node.mining_target
-            if ancestor.height > block.height:
-                ancestor, block = block, ancestor
-            while ancestor.height < block.height:
-                assert block.parent is not None
-                block = block.parent
-            while ancestor != block:
-                assert block.parent is not None
-                block = block.parent
-                assert ancestor.parent is not None
-                ancestor = ancestor.parent
+            ancestor = common_ancestor(ancestor, node.mining_target)
         return ancestor.height
 
 
-def plot_timeline(start_time: float, end_time: float, num_nodes: int, download_log: Dict[Node, List[Tuple[Block, float, float]]]) -> None:
+def mining_rates(run_config: RunConfig) -> List[float]:
+    """the mining rates of the nodes of an experiment, in the order in which the experiment creates them"""
+    attackers = [run_config.dumb_attacker, run_config.private_attacker,
+                 run_config.teasing_attacker, run_config.equivocation_teasing_attacker]
+    return [rate for rate in attackers if rate] + \
+        [run_config.honest_block_rate] * (run_config.num_honest + run_config.num_spv)
+
+
+def check_mining_schedule(mining_schedule: MiningSchedule, run_config: RunConfig) -> None:
+    if mining_schedule.mining_rates != mining_rates(run_config):
+        raise ValueError(
+            "The mining schedule was generated for different mining rates than the nodes of this experiment")
+    if mining_schedule.end_time < run_config.run_time:
+        raise ValueError(
+            f"The mining schedule ends at {mining_schedule.end_time}, before the end of the run ({run_config.run_time})")
+
+
+def partition_schedule(run_config: RunConfig) -> List[Tuple[float, Union[None, int, List[int]]]]:
+    """the (time, assignment) entries of the partition schedule file of the run (see network.partition_labels), in order of time.
+    An induced split is the schedule [(start, 2), (end, None)]: the first half of the nodes is split off from start to end."""
+    if run_config.induce_split is not None and run_config.partition_schedule:
+        raise ValueError(
+            "An induced split is a partition schedule of its own, do not use both")
+    if run_config.induce_split is not None:
+        split_start, split_end = run_config.induce_split
+        if split_end <= split_start:
+            return []
+        return [(split_start, 2), (split_end, None)]
+    if not run_config.partition_schedule:
+        return []
+    with open(run_config.partition_schedule, 'r') as in_file:
+        entries = [(float(time), assignment)
+                   for time, assignment in json.load(in_file)]
+    if any(time < 0 for time, _ in entries):
+        raise ValueError("A partition schedule cannot change the network before time 0")
+    # (entries at the same time are applied in the order of the file)
+    return sorted(entries, key=lambda entry: entry[0])
+
+
+def create_engine(engine: str) -> EventEngine:
+    if engine == EventEngines.Simpy.value:
+        return SimpyEngine()
+    elif engine == EventEngines.Heap.value:
+        return HeapEngine()
+    raise ValueError("Unsupported event engine:" + str(engine))
+
+
+def plot_timeline(start_time: float, end_time: float, num_nodes: int, download_log: Dict[Node, List[Tuple[Block, float, float]]],
+                  all_blocks: List[Block]) -> None:
     import plotly.graph_objects as go  # type: ignore
     import plotly.express as px  # type: ignore
 
@@ -187,25 +279,25 @@ def plot_timeline(start_time: float, end_time: float, num_nodes: int, download_l
                 continue
             fig.add_shape(type="rect", xref="x", yref="y", x0=start, x1=end,
                           y0=node.id-height/2, y1=node.id + height/2,
-                          fillcolor=colors[hash(block) % len(colors)], line=dict(color="black", width=1), opacity=0.2, layer="below")
+                          fillcolor=colors[block.id % len(colors)], line=dict(color="black", width=1), opacity=0.2, layer="below")
             fig.add_annotation(
-                x=(start+end)/2, y=node.id - height, xref='x', yref='y', text=str(block.id), opacity=0.3,
+                x=(start+end)/2, y=node.id - height, xref='x', yref='y', text=block.label, opacity=0.3,
                 showarrow=False)
 
     # plotting of blocks using markers
     print("drawing block markers")
-    x_vals = [block.creation_time for block in Block.all_blocks if start_time <=
+    x_vals = [block.creation_time for block in all_blocks if start_time <=
               block.creation_time <= end_time]
-    y_vals = [block.miner.id if block.miner else 0 for block in Block.all_blocks if start_time <=
+    y_vals = [block.miner.id if block.miner else 0 for block in all_blocks if start_time <=
               block.creation_time <= end_time]
-    text = [str(block.id) for block in Block.all_blocks if start_time <=
+    text = [block.label for block in all_blocks if start_time <=
             block.creation_time <= end_time]
     fig.add_trace(go.Scatter(mode="markers+text", x=x_vals, y=y_vals, text=text, textposition="top center", marker_symbol="square",
                              marker_line_color="midnightblue", marker_color="lightskyblue",
                              marker_line_width=2, marker_size=10))
 
     print("drawing block arrows")
-    for block in Block.all_blocks:
+    for block in all_blocks:
         miner_id = block.miner.id if block.miner else 0
 
         if start_time <= block.creation_time <= end_time:
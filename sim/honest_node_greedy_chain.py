@@ -1,16 +1,35 @@
-
 from typing import Optional
 from .block import Block
 from .node import Node
 import sim.network as network
-from typing import Dict
+from typing import Dict, List, Set, Tuple
+import heapq
 
 
 class HonestNodeGreedy(Node):
+    """Downloads towards the candidate (the lowest missing block on the way to a known tip) that is highest,
+    preferring higher tips among equally high candidates.
+
+    The tips are tracked in an insertion ordered map (ties are resolved in favor of earlier tips),
+    with two heaps over it: a max heap for choosing the download and a min heap for eviction.
+    Heap entries carry the version of the tip's record at the time they were pushed, and are skipped once the record changes.
+    A candidate only becomes stale when it is downloaded (blocks never become unavailable after they are created),
+    so only the tips that changed since the last decision are re-examined."""
+
     def __init__(self, genesis: Block, mining_rate: float, bandwidth: float,
                  header_delay: float, network: network.Network, buffer_size: int = 100) -> None:
         super().__init__(genesis, mining_rate, bandwidth, header_delay, network)
-        self.__tip_to_candidate: Dict[Block, Block] = {}
+        # tip -> [candidate, insertion order, version]:
+        self.__tip_to_candidate: Dict[Block, List] = {}
+        self.__candidate_to_tips: Dict[Block, Set[Block]] = {}
+        # (-candidate height, -tip height, insertion order, version, tip):
+        self.__best: List[Tuple[int, int, int, int, Block]] = []
+        # (candidate height, tip height, insertion order, version, tip):
+        self.__worst: List[Tuple[int, int, int, int, Block]] = []
+        # tips that were added or whose candidate was downloaded since the last decision:
+        self.__changed_tips: Set[Block] = set()
+        self.__insertion_counter = 0
+        self.__version_counter = 0
         self.__buffer_size = buffer_size
 
     def mine_block(self) -> Block:
@@ -22,42 +41,79 @@ class HonestNodeGreedy(Node):
 
     def receive_header(self, tip: Block) -> None:
         super().receive_header(tip)
-        if tip in self._downloaded_blocks:
+        if self._has_downloaded(tip):
             return
         if tip in self.__tip_to_candidate:
             return
         candidate: Optional[Block] = None
         if tip.parent in self.__tip_to_candidate:
             # we delete the parent from the tip mapping, but not before we try to use it to find our way back to the downloaded chain to get our correct candidate
-            potential_candidate = self.__tip_to_candidate[tip.parent]
-            del self.__tip_to_candidate[tip.parent]
-            if potential_candidate not in self._downloaded_blocks:
+            potential_candidate = self.__tip_to_candidate[tip.parent][0]
+            self._remove_tip(tip.parent)
+            if not self._has_downloaded(potential_candidate):
                 candidate = potential_candidate
         if candidate is None:
             candidate = self._get_candidate(tip)
-        self.__tip_to_candidate[tip] = candidate
+        self._add_tip(tip, candidate)
+        # (indexed right away, so that eviction can pick the new tip)
+        self._push_tip(tip)
 
         self._evict_if_needed()
         self._reconsider_next_download()
 
+    def _add_tip(self, tip: Block, candidate: Block) -> None:
+        """adds the tip at the end of the insertion order. It is indexed by the next decision (or explicitly, with _push_tip)"""
+        self.__insertion_counter += 1
+        self.__tip_to_candidate[tip] = [
+            candidate, self.__insertion_counter, 0]
+        self.__candidate_to_tips.setdefault(candidate, set()).add(tip)
+        self.__changed_tips.add(tip)
+
+    def _push_tip(self, tip: Block) -> None:
+        """indexes the current record of the tip (and invalidates the heap entries of its previous records)"""
+        record = self.__tip_to_candidate[tip]
+        self.__version_counter += 1
+        record[2] = self.__version_counter
+        candidate, order, version = record
+        heapq.heappush(self.__best, (-candidate.height, -
+                       tip.height, order, version, tip))
+        heapq.heappush(self.__worst, (candidate.height,
+                       tip.height, order, version, tip))
+        self._compact_if_needed()
+
+    def _remove_tip(self, tip: Block) -> None:
+        candidate = self.__tip_to_candidate.pop(tip)[0]
+        tips = self.__candidate_to_tips[candidate]
+        tips.discard(tip)
+        if not tips:
+            del self.__candidate_to_tips[candidate]
+        self.__changed_tips.discard(tip)
+
+    def _is_current(self, entry: Tuple[int, int, int, int, Block]) -> bool:
+        record = self.__tip_to_candidate.get(entry[4])
+        return record is not None and record[2] == entry[3]
+
+    def _compact_if_needed(self) -> None:
+        if len(self.__best) <= 4 * len(self.__tip_to_candidate) + 64:
+            return
+        self.__best = [entry for entry in self.__best if self._is_current(entry)]
+        self.__worst = [
+            entry for entry in self.__worst if self._is_current(entry)]
+        heapq.heapify(self.__best)
+        heapq.heapify(self.__worst)
+
     def _evict_if_needed(self) -> None:
         if len(self.__tip_to_candidate) <= self.__buffer_size:
             return
 
-        worst_tip = next(iter(self.__tip_to_candidate.keys()))
-        worst_candidate_height = self.__tip_to_candidate[worst_tip].height
-        for tip, candidate in self.__tip_to_candidate.items():
-            if candidate.height < worst_candidate_height or candidate.height == worst_candidate_height and tip.height < worst_tip.height:
-                worst_tip = tip
-                worst_candidate_height = candidate.height
-        del self.__tip_to_candidate[worst_tip]
+        # the lowest candidate, then the lowest tip, then the earliest tip:
+        while not self._is_current(self.__worst[0]):
+            heapq.heappop(self.__worst)
+        worst_tip = heapq.heappop(self.__worst)[4]
+        self._remove_tip(worst_tip)
 
     def _get_candidate(self, tip: Block) -> Block:
-        cur = tip
-        while cur.parent not in self._downloaded_blocks:
-            assert cur.parent is not None, "parent of cur was found to be none!"
-            cur = cur.parent
-        return cur
+        return self._lowest_missing_ancestor(tip)
 
     def _reconsider_next_download(self) -> None:
         # find the preferred download target:
@@ -67,36 +123,72 @@ class HonestNodeGreedy(Node):
     def _find_preferred_download_target(self) -> Optional[Block]:
         best_candidate: Optional[Block] = None
         best_candidate_tip_height = 0
-
-        for tip, candidate in list(self.__tip_to_candidate.items()):
-            if candidate in self._downloaded_blocks:
-                new_candidate = self._get_candidate(tip)
-                del self.__tip_to_candidate[tip]
-                if new_candidate is None:
-                    continue
+        best_candidate_order = 0
+
+        # the changed tips are re-examined in insertion order. Their old heap entries are invalidated first,
+        # so that the heap only offers the unchanged tips:
+        changed_tips = sorted(self.__changed_tips,
+                              key=lambda tip: self.__tip_to_candidate[tip][1])
+        examined = []
+        for tip in changed_tips:
+            candidate, order, _ = self.__tip_to_candidate[tip]
+            self.__version_counter += 1
+            self.__tip_to_candidate[tip][2] = self.__version_counter
+            if self._has_downloaded(candidate):
+                # the tip moves to the end of the insertion order:
+                # (the new candidate is above the old one)
+                new_candidate = self._lowest_missing_ancestor(
+                    tip, candidate.height)
+                self._remove_tip(tip)
+                self._add_tip(tip, new_candidate)
                 candidate = new_candidate
-                self.__tip_to_candidate[tip] = new_candidate
             if not candidate.is_available:
-                del self.__tip_to_candidate[tip]
-
+                # (the tip is dropped, but its candidate is still considered this time)
+                self._remove_tip(tip)
+            examined.append((candidate, tip, order))
+        self.__changed_tips = set()
+
+        while self.__best and not self._is_current(self.__best[0]):
+            heapq.heappop(self.__best)
+        if self.__best:
+            _, _, order, _, tip = self.__best[0]
+            examined.append((self.__tip_to_candidate[tip][0], tip, order))
+
+        for candidate, tip, order in examined:
             if best_candidate is None or \
                     best_candidate.height < candidate.height or \
-                    best_candidate.height == candidate.height and tip.height > best_candidate_tip_height:
+                    best_candidate.height == candidate.height and tip.height > best_candidate_tip_height or \
+                    best_candidate.height == candidate.height and tip.height == best_candidate_tip_height and order < best_candidate_order:
                 best_candidate = candidate
                 best_candidate_tip_height = tip.height
+                best_candidate_order = order
+
+        for tip in changed_tips:
+            if tip in self.__tip_to_candidate:
+                self._push_tip(tip)
         return best_candidate
 
     def download_complete(self, block: Block) -> None:
         super().download_complete(block)
-        for tip, candidate in list(self.__tip_to_candidate.items()):
-            if candidate == block:
-                if tip != block:
-                    assert tip not in self._downloaded_blocks, "tip found in downloaded blocks"
-                    new_candidate = self._get_candidate(block)
-                    self.__tip_to_candidate[tip] = new_candidate
-                else:
-                    del self.__tip_to_candidate[tip]
+        for tip in list(self.__candidate_to_tips.get(block, ())):
+            if tip != block:
+                assert not self._has_downloaded(tip), "tip found in downloaded blocks"
+                new_candidate = self._get_candidate(block)
+                self._set_candidate(tip, new_candidate)
+            else:
+                self._remove_tip(tip)
         self._reconsider_next_download()
 
+    def _set_candidate(self, tip: Block, candidate: Block) -> None:
+        """replaces the candidate of a tip in place (it keeps its insertion order)"""
+        record = self.__tip_to_candidate[tip]
+        old_tips = self.__candidate_to_tips[record[0]]
+        old_tips.discard(tip)
+        if not old_tips:
+            del self.__candidate_to_tips[record[0]]
+        record[0] = candidate
+        self.__candidate_to_tips.setdefault(candidate, set()).add(tip)
+        self.__changed_tips.add(tip)
+
     def download_interrupted(self, block: Block, fraction_downloaded: float) -> None:
         return super().download_interrupted(block, fraction_downloaded)
@@ -1,5 +1,5 @@
 
-from typing import Optional
+from typing import List, Optional
 from .block import Block
 from .node import Node
 import sim.network as network
@@ -12,6 +12,9 @@ class HonestNodeLongestHeaderChain(Node):
         super().__init__(genesis, mining_rate, bandwidth, header_delay, network)
         self.__dl_queue: LimittedQueue[Block,
                                        int] = LimittedQueue(buffer_size=100)
+        # the last tip that a download target was searched for, and the target (its lowest missing ancestor) at the time:
+        self.__frontier_tip = genesis
+        self.__frontier = genesis
 
     def mine_block(self) -> Block:
         block = super().mine_block()
@@ -25,6 +28,13 @@ class HonestNodeLongestHeaderChain(Node):
         self.__dl_queue.enqueue(block, block.height)
         self._reconsider_next_download()
 
+    def receive_headers(self, blocks: List[Block]) -> None:
+        # the whole batch is queued before the next download is chosen:
+        for block in blocks:
+            super().receive_header(block)
+        self.__dl_queue.enqueue_many((block, block.height) for block in blocks)
+        self._reconsider_next_download()
+
     def _reconsider_next_download(self) -> None:
         # find the preferred download target:
         preferred_download = self._find_preferred_download_target()
@@ -33,14 +43,12 @@ class HonestNodeLongestHeaderChain(Node):
     def _find_preferred_download_target(self) -> Optional[Block]:
         while len(self.__dl_queue) > 0:
             block = self.__dl_queue.peek()
-            if block in self._downloaded_blocks:
+            if self._has_downloaded(block):
                 self.__dl_queue.dequeue()
                 continue
 
-            cur: Block = block
             # travel back to a block that has a downloaded parent
-            while cur.parent and cur.parent not in self._downloaded_blocks:
-                cur = cur.parent
+            cur = self._download_frontier(block)
 
             # if the block we want to download is discovered as unavailable, we remove the tip from further consideration (it needs to be re-anounced if it is to be considered again)
             if not cur.is_available:
@@ -49,6 +57,21 @@ class HonestNodeLongestHeaderChain(Node):
             return cur
         return None
 
+    def _download_frontier(self, tip: Block) -> Block:
+        """the lowest ancestor of the tip that is not downloaded yet. Downloads only move the frontier of a tip up, 
+        so if the tip is the last tip or extends it (as it does for most headers and download completions), 
+        the search resumes from the last frontier instead of starting over."""
+        frontier = self.__frontier
+        last_tip = self.__frontier_tip
+        if tip.height >= last_tip.height and tip.ancestor(last_tip.height) is last_tip:
+            if self._has_downloaded(frontier):
+                frontier = self._lowest_missing_ancestor(tip, frontier.height)
+        else:
+            frontier = self._lowest_missing_ancestor(tip)
+        self.__frontier_tip = tip
+        self.__frontier = frontier
+        return frontier
+
     def download_complete(self, block: Block) -> None:
         super().download_complete(block)
         self._reconsider_next_download()
@@ -1,41 +1,72 @@
-from typing import TypeVar, Generic, List, Tuple
+from typing import TypeVar, Generic, Deque, Dict, Iterable, List, Set, Tuple
+import bisect
+import collections
 
 ITEM_TYPE = TypeVar('ITEM_TYPE')
 PRIO_TYPE = TypeVar('PRIO_TYPE')
 
 
 class LimittedQueue(Generic[ITEM_TYPE, PRIO_TYPE]):
-    """max priority queue that keeps only the top k items. 
-    Enqueue is O(n) where n is the actual queue size, dequeue is O(1)
-    If two equal priority items are placed inside the queue, the earlier one has higher priority"""
+    """max priority queue that keeps only the top k items (priorities are numbers).
+    If two equal priority items are placed inside the queue, the earlier one has higher priority.
+
+    When a full queue takes an item, the items below it step down, as they did when the queue was a sorted list
+    that carried the displaced item down to the bottom: the first item of every lower priority moves behind the other items
+    of its priority, and the first item of the lowest priority is evicted.
+
+    Items are kept in groups of equal priority, with a sorted list of the priorities. Enqueue and dequeue are O(log n)
+    plus the number of groups that hold more than one item, which is what an item stepping down has to reorder."""
 
     def __init__(self, buffer_size: int = 10) -> None:
-        # a list of recent items entered to the queue:
-        self._queue: List[Tuple[PRIO_TYPE, ITEM_TYPE]] = list()
         self._buffer_size = buffer_size
+        self.__size = 0
+        # priority -> the items of that priority, the first one on top:
+        self.__groups: Dict[PRIO_TYPE, Deque[ITEM_TYPE]] = {}
+        # the priorities of the groups in ascending order, and the ones of groups with more than one item:
+        self.__priorities: List[PRIO_TYPE] = []
+        self.__ties: Set[PRIO_TYPE] = set()
 
     def enqueue(self, item: ITEM_TYPE, priority: PRIO_TYPE) -> None:
-        rec = priority, item
-        if len(self._queue) >= self._buffer_size:
-            for ind in range(len(self._queue)-1, -1, -1):
-                if self._queue[ind][0] < rec[0]:  # type: ignore
-                    rec, self._queue[ind] = self._queue[ind], rec
-        else:
-            self._queue.append(rec)
-            ind = len(self._queue)-2
-
-            while ind > -1 and \
-                    self._queue[ind][0] >= self._queue[ind+1][0]:  # type: ignore
-                self._queue[ind], self._queue[ind +
-                                              1] = self._queue[ind+1], self._queue[ind]
-                ind -= 1
+        if self.__size >= self._buffer_size:
+            lowest = self.__priorities[0]
+            # an item that is not above the lowest priority is evicted on arrival:
+            if priority <= lowest:  # type: ignore
+                return
+            for tie in self.__ties:
+                if lowest < tie < priority:  # type: ignore
+                    self.__groups[tie].rotate(-1)
+            self.__pop_first(lowest)
+
+        group = self.__groups.get(priority)
+        if group is None:
+            group = self.__groups[priority] = collections.deque()
+            bisect.insort(self.__priorities, priority)  # type: ignore
+        elif len(group) == 1:
+            self.__ties.add(priority)
+        group.append(item)
+        self.__size += 1
+
+    def enqueue_many(self, items: Iterable[Tuple[ITEM_TYPE, PRIO_TYPE]]) -> None:
+        """enqueues (item, priority) pairs in order (a burst of items is mostly evicted on arrival)"""
+        for item, priority in items:
+            self.enqueue(item, priority)
 
     def dequeue(self) -> ITEM_TYPE:
-        _, result = self._queue.pop()
-        return result
+        return self.__pop_first(self.__priorities[-1])
 
     def peek(self) -> ITEM_TYPE:
-        return self._queue[-1][1]
+        return self.__groups[self.__priorities[-1]][0]
 
     def __len__(self) -> int:
-        return len(self._queue)
+        return self.__size
+
+    def __pop_first(self, priority: PRIO_TYPE) -> ITEM_TYPE:
+        group = self.__groups[priority]
+        item = group.popleft()
+        if not group:
+            del self.__groups[priority]
+            del self.__priorities[bisect.bisect_left(self.__priorities, priority)]  # type: ignore
+        elif len(group) == 1:
+            self.__ties.discard(priority)
+        self.__size -= 1
+        return item
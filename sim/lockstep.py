@@ -0,0 +1,157 @@
+from typing import Any, Dict, List
+import dataclasses
+import numpy
+
+from .configuration import RunConfig
+from .experiment import mining_rates
+from .mining_schedule import generate_mining_schedule
+
+
+def check_lockstep_config(run_config: RunConfig) -> None:
+    """the lockstep engine only covers the pure delay model: honest nodes that learn every block after the header delay
+    and download it instantly (no bandwidth), with no attackers, SPV nodes or splits."""
+    unsupported = []
+    if run_config.mode != "pow":
+        unsupported.append(f"mode {run_config.mode}")
+    if run_config.bandwidth > 0:
+        unsupported.append("a positive bandwidth")
+    if run_config.dumb_attacker or run_config.private_attacker or \
+            run_config.teasing_attacker or run_config.equivocation_teasing_attacker:
+        unsupported.append("attackers")
+    if run_config.num_spv:
+        unsupported.append("SPV nodes")
+    if run_config.induce_split or run_config.partition_schedule:
+        unsupported.append("network splits")
+    if run_config.topology:
+        unsupported.append("a topology")
+    if run_config.mining_schedule:
+        unsupported.append("a mining schedule")
+    if run_config.plot or run_config.log_blocks:
+        unsupported.append("plots and block logs")
+    if unsupported:
+        raise ValueError(
+            f"The lockstep engine does not support {', '.join(unsupported)}")
+
+
+def run_lockstep(run_configs: List[RunConfig]) -> List[Dict[str, Any]]:
+    """runs the configurations (replications of one model that differ only in their seeds and output files) together as arrays,
+    and returns the results of Experiment.get_results for each. The blocks of a replication are the ones an Experiment draws 
+    with the same seed, so the results match run_experiment with that seed.
+
+    With instant downloads, a node mines on the highest block it knows of, and keeps the first one it learnt of among equally high blocks.
+    It learns of its own blocks when it mines them and of any other block after the header delay. Since every block reaches all
+    other nodes after the same delay, the blocks that the others know of at any time are a prefix of the blocks in the order they were mined,
+    so a node's tip is the better of its own last block and the best block of that prefix."""
+    run_config = run_configs[0]
+    for other in run_configs:
+        check_lockstep_config(other)
+        if other.seed is None:
+            raise ValueError("lockstep replications need explicit seeds")
+        if (other.run_time, other.header_delay, mining_rates(other)) != \
+                (run_config.run_time, run_config.header_delay, mining_rates(run_config)):
+            raise ValueError(
+                "lockstep replications must share the run time, the header delay and the mining rates")
+    seeds = [other.seed for other in run_configs]
+    rates = mining_rates(run_config)
+    run_time = run_config.run_time
+    header_delay = run_config.header_delay
+    num_replications = len(seeds)
+    num_nodes = len(rates)
+
+    schedules = [generate_mining_schedule(
+        rates, run_time, seed) for seed in seeds]
+    # block 0 is the genesis (known to all from the start), the blocks mined in each replication follow it.
+    # Blocks that would be mined after the run time are never mined:
+    num_blocks = 1 + max(len(schedule) for schedule in schedules)
+    times = numpy.full((num_replications, num_blocks), numpy.inf)
+    miners = numpy.zeros((num_replications, num_blocks), dtype=numpy.int64)
+    times[:, 0] = -numpy.inf
+    for replication, schedule in enumerate(schedules):
+        block_times = schedule.block_times
+        mined = block_times < run_time
+        times[replication, 1:1 + len(schedule)][mined] = block_times[mined]
+        miners[replication, 1:1 + len(schedule)] = schedule.miners
+    arrival_times = times + header_delay
+
+    # the number of blocks (genesis included) that reach the other nodes by the time each block is mined:
+    num_known = numpy.empty((num_replications, num_blocks), dtype=numpy.int64)
+    for replication in range(num_replications):
+        num_known[replication] = numpy.searchsorted(
+            arrival_times[replication], times[replication], side="right")
+    num_known = numpy.minimum(num_known, numpy.arange(num_blocks))
+
+    heights = numpy.zeros((num_replications, num_blocks), dtype=numpy.int64)
+    parents = numpy.zeros((num_replications, num_blocks), dtype=numpy.int64)
+    # the highest (and earliest among equally high) of the blocks 0..b:
+    best_of_prefix = numpy.zeros(
+        (num_replications, num_blocks), dtype=numpy.int64)
+    # the last block of every node (-1 before its first block):
+    own_tips = numpy.full((num_replications, num_nodes), -1, dtype=numpy.int64)
+
+    rows = numpy.arange(num_replications)
+    for block in range(1, num_blocks):
+        is_mined = times[:, block] < numpy.inf
+        if not is_mined.any():
+            break
+        miner = miners[:, block]
+        parent = _better_tip(own_tips[rows, miner], best_of_prefix[rows, num_known[:, block] - 1],
+                             heights, times, arrival_times, rows)
+
+        heights[:, block] = heights[rows, parent] + 1
+        parents[:, block] = parent
+        own_tips[rows[is_mined], miner[is_mined]] = block
+
+        prev_best = best_of_prefix[:, block - 1]
+        best_of_prefix[:, block] = numpy.where(is_mined & (heights[:, block] > heights[rows, prev_best]),
+                                               block, prev_best)
+
+    # the tips of all nodes at the end of the run:
+    num_known_at_end = numpy.array([numpy.searchsorted(arrival_times[replication], run_time, side="left")
+                                    for replication in range(num_replications)])
+    known_best = best_of_prefix[rows, num_known_at_end - 1]
+    tips = _better_tip(own_tips, numpy.broadcast_to(known_best[:, None], own_tips.shape),
+                       heights, times, arrival_times, rows[:, None])
+
+    tip_heights = heights[rows[:, None], tips]
+    common_ancestors = _common_ancestors(tips, heights, parents)
+
+    results = []
+    for replication, replication_config in enumerate(run_configs):
+        result: Dict[str, Any] = {}
+        result["config"] = dataclasses.asdict(replication_config)
+        result["seed"] = replication_config.seed
+        result["honest_chain_height"] = int(tip_heights[replication].max())
+        result["honest_chain_common_ancestor_height"] = int(
+            heights[replication, common_ancestors[replication]])
+        results.append(result)
+    return results
+
+
+def _better_tip(own_tip: numpy.ndarray, known_best: numpy.ndarray, heights: numpy.ndarray, times: numpy.ndarray,
+                arrival_times: numpy.ndarray, rows: numpy.ndarray) -> numpy.ndarray:
+    """a node prefers its own last block if it is higher than the best block it learnt of from others,
+    or if it is as high and it had it first. (The best known block may be the node's own block, which the node had even earlier.)"""
+    has_own = own_tip >= 0
+    own = numpy.where(has_own, own_tip, 0)
+    own_height = numpy.where(has_own, heights[rows, own], -1)
+    known_height = heights[rows, known_best]
+    prefer_own = (own_height > known_height) | \
+        ((own_height == known_height) & (times[rows, own] <= arrival_times[rows, known_best]))
+    return numpy.where(prefer_own, own, known_best)
+
+
+def _common_ancestors(tips: numpy.ndarray, heights: numpy.ndarray, parents: numpy.ndarray) -> numpy.ndarray:
+    """the common ancestor of the tips of every replication: the highest tips step back until they all meet"""
+    rows = numpy.arange(tips.shape[0])[:, None]
+    current = tips.copy()
+    while True:
+        have_met = (current == current[:, :1]).all(axis=1)
+        if have_met.all():
+            return current[:, 0]
+        current_heights = heights[rows, current]
+        lowest = current_heights.min(axis=1, keepdims=True)
+        # step back the highest blocks, or all of them once they are equally high (and have not met yet):
+        all_equally_high = lowest == current_heights.max(axis=1, keepdims=True)
+        step_back = ~have_met[:, None] & (
+            (current_heights > lowest) | all_equally_high)
+        current = numpy.where(step_back, parents[rows, current], current)
@@ -1,34 +1,96 @@
 from .node import Node
-from typing import List, Generator
-import random
-import simpy.core
-import simpy.events
+from .engine import EventEngine
+from typing import List, Optional, Sequence, Union, TYPE_CHECKING
+import numpy
 import numpy.random
+if TYPE_CHECKING:
+    from .mining_schedule import MiningSchedule
+    from .node_population import PopulationNode
 
 
 class PoWMiningOracle:
-    def __init__(self, env: simpy.core.Environment, nodes: List[Node]):
-        self.__nodes = nodes[:]
+    """Draws block times and miners in chunks of `chunk_size` and refills a chunk when it runs out.
+    Miners are selected with an alias table, so selecting a miner is O(1) regardless of the number of nodes.
+    If a pre-generated schedule is given, blocks are mined according to it (and no more blocks are mined once it runs out)."""
+
+    def __init__(self, env: EventEngine, nodes: Sequence[Union[Node, "PopulationNode"]], time_rng: numpy.random.Generator, miner_rng: numpy.random.Generator,
+                 chunk_size: int = 4096, schedule: Optional["MiningSchedule"] = None):
+        self.__nodes = list(nodes)
         self.__weights = [node.mining_rate for node in nodes]
         self.__total_mining_power = sum(self.__weights)
+        self.__alias_table = AliasTable(self.__weights)
         self.__env = env
+        self.__chunk_size = chunk_size
+
+        # block times and miners are drawn from separate streams:
+        self.__time_rng = time_rng
+        self.__miner_rng = miner_rng
+        self.__times_to_next_block: List[float] = []
+        self.__miner_indices: List[int] = []
+
+        self.__schedule = schedule
+        if schedule is not None:
+            if len(schedule.mining_rates) != len(nodes):
+                raise ValueError(
+                    f"the mining schedule is for {len(schedule.mining_rates)} miners, but there are {len(nodes)} nodes")
+            self.__times_to_next_block = schedule.times_to_next_block[::-1].tolist()
+            self.__miner_indices = schedule.miners[::-1].tolist()
 
         # start the mining events:
-        self.__env.process(self.run_mining())
+        self.__schedule_next_block()
+
+    def __schedule_next_block(self) -> None:
+        if not self.__times_to_next_block:
+            if self.__schedule is not None:
+                return
+            # reversed, so that the chunk is consumed in order by popping from its end
+            self.__times_to_next_block = get_times_to_next_block(
+                self.__total_mining_power, self.__time_rng, self.__chunk_size)[::-1].tolist()
+        self.__env.schedule(self.__times_to_next_block.pop(),
+                            self.__mine_next_block)
+
+    def __mine_next_block(self) -> None:
+        # select miner by relative weight
+        if not self.__miner_indices:
+            self.__miner_indices = self.__alias_table.sample(
+                self.__miner_rng, self.__chunk_size)[::-1].tolist()
+        miner = self.__nodes[self.__miner_indices.pop()]
+        miner.mine_block()
+        self.__schedule_next_block()
+
+
+def get_times_to_next_block(lambda_param: float, rng: numpy.random.Generator, size: int) -> numpy.ndarray:
+    return rng.exponential(1/lambda_param, size)
+
 
-    def run_mining(self) -> Generator[simpy.events.Timeout, None, None]:
-        while True:
-            time_to_next_block = get_time_to_next_block(
-                self.__total_mining_power)
-            yield (self.__env.timeout(time_to_next_block))
+class AliasTable:
+    """Walker's alias method (Vose's variant) for sampling indices by relative weight. 
+    Building the table is O(n), and each sample is O(1)."""
 
-            # select miner by relative weight
-            miner, = random.choices(self.__nodes, weights=self.__weights, k=1)
-            miner.mine_block()
+    def __init__(self, weights: List[float]) -> None:
+        num_items = len(weights)
+        scaled = numpy.asarray(weights, dtype=float) * \
+            num_items / sum(weights)
+        self.__prob = numpy.ones(num_items)
+        self.__alias = numpy.arange(num_items)
 
+        small = [i for i in range(num_items) if scaled[i] < 1]
+        large = [i for i in range(num_items) if scaled[i] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.__prob[less] = scaled[less]
+            self.__alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # whatever remains (in either list) has probability 1 up to rounding errors, and keeps the default entries.
 
-def get_time_to_next_block(lambda_param: float) -> float:
-    return numpy.random.exponential(1/lambda_param)
+    def sample(self, rng: numpy.random.Generator, size: int) -> numpy.ndarray:
+        columns = rng.integers(len(self.__prob), size=size)
+        coin_tosses = rng.random(size)
+        return numpy.where(coin_tosses < self.__prob[columns], columns, self.__alias[columns])
 
 
 # class PoSMiningOracle:
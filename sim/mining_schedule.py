@@ -0,0 +1,123 @@
+from typing import List, Optional, Sequence
+import argparse
+import numpy
+import numpy.random
+
+from .mining_oracle import AliasTable, get_times_to_next_block
+
+
+class MiningSchedule:
+    """A pre-generated sequence of mined blocks: the time from each block to the next and the index of its miner.
+    Miner indices refer to the nodes of an experiment in the order they are created (see experiment.mining_rates).
+
+    Feeding the same schedule to several experiments runs them on identical randomness (common random numbers),
+    so paired comparisons need far fewer repetitions."""
+
+    def __init__(self, times_to_next_block: numpy.ndarray, miners: numpy.ndarray, mining_rates: Sequence[float],
+                 end_time: Optional[float] = None) -> None:
+        if len(times_to_next_block) != len(miners):
+            raise ValueError(
+                "a mining schedule needs a miner for every block time")
+        self.__times_to_next_block = numpy.asarray(
+            times_to_next_block, dtype=numpy.float64)
+        self.__miners = numpy.asarray(miners, dtype=numpy.int32)
+        self.__mining_rates = [float(rate) for rate in mining_rates]
+        if end_time is None:
+            end_time = float(numpy.sum(self.__times_to_next_block))
+        self.__end_time = end_time
+
+    @property
+    def times_to_next_block(self) -> numpy.ndarray:
+        return self.__times_to_next_block
+
+    @property
+    def block_times(self) -> numpy.ndarray:
+        return numpy.cumsum(self.__times_to_next_block)
+
+    @property
+    def miners(self) -> numpy.ndarray:
+        return self.__miners
+
+    @property
+    def mining_rates(self) -> List[float]:
+        return self.__mining_rates[:]
+
+    @property
+    def end_time(self) -> float:
+        """the schedule holds every block mined up to this time (by default, the time of its last block)"""
+        return self.__end_time
+
+    def __len__(self) -> int:
+        return len(self.__miners)
+
+    def without_miners(self, removed: Sequence[int]) -> "MiningSchedule":
+        """returns the schedule of the remaining miners: the blocks of the removed miners are dropped and the rest are re-indexed.
+        Since the schedule is a superposition of independent Poisson processes, this is a valid schedule for the remaining miners."""
+        keep = numpy.ones(len(self.__mining_rates), dtype=bool)
+        keep[list(removed)] = False
+        new_index = numpy.cumsum(keep) - 1
+
+        kept_blocks = keep[self.__miners]
+        block_times = self.block_times[kept_blocks]
+        times_to_next_block = numpy.diff(block_times, prepend=0.0)
+        miners = new_index[self.__miners[kept_blocks]]
+        mining_rates = [rate for i, rate in enumerate(
+            self.__mining_rates) if keep[i]]
+        return MiningSchedule(times_to_next_block, miners, mining_rates, self.__end_time)
+
+    def save(self, file_name: str) -> None:
+        numpy.savez(file_name, times_to_next_block=self.__times_to_next_block,
+                    miners=self.__miners, mining_rates=numpy.asarray(self.__mining_rates), end_time=self.__end_time)
+
+    @staticmethod
+    def load(file_name: str) -> "MiningSchedule":
+        with numpy.load(file_name) as data:
+            return MiningSchedule(data["times_to_next_block"], data["miners"], data["mining_rates"].tolist(), float(data["end_time"]))
+
+
+def generate_mining_schedule(mining_rates: Sequence[float], run_time: float, seed: Optional[int] = None,
+                             chunk_size: int = 4096) -> MiningSchedule:
+    """draws blocks until the first block that is mined after run_time (so the schedule always outlasts the run).
+    The draws are the same ones a live mining oracle makes in an experiment with the same seed."""
+    time_rng, miner_rng = [numpy.random.default_rng(child)
+                           for child in numpy.random.SeedSequence(seed).spawn(2)]
+    total_mining_power = sum(mining_rates)
+
+    chunks = []
+    elapsed_time = 0.0
+    while elapsed_time <= run_time:
+        chunk = get_times_to_next_block(
+            total_mining_power, time_rng, chunk_size)
+        chunks.append(chunk)
+        elapsed_time += float(numpy.sum(chunk))
+    times_to_next_block = numpy.concatenate(chunks)
+
+    num_blocks = int(numpy.searchsorted(
+        numpy.cumsum(times_to_next_block), run_time, side="right")) + 1
+    times_to_next_block = times_to_next_block[:num_blocks]
+    # miners are drawn chunk by chunk, exactly as the live mining oracle draws them:
+    alias_table = AliasTable(list(mining_rates))
+    miners = numpy.concatenate([alias_table.sample(miner_rng, chunk_size)
+                                for _ in range(len(chunks))])[:num_blocks]
+    return MiningSchedule(times_to_next_block, miners, mining_rates)
+
+
+def setup_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='mining_schedule',
+        description='Generate a mining schedule that can be shared by several runs (see --mining_schedule of run_experiment).')
+
+    parser.add_argument("--mining_rates", nargs="+", type=float, required=True,
+                        help="mining rate of every node, in the order the experiment creates them (attackers, honest nodes, SPV nodes)")
+    parser.add_argument("--run_time", type=float, required=True,
+                        help="time the schedule needs to cover")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the schedule")
+    parser.add_argument("--out", type=str, required=True,
+                        help="filename (where to save the schedule, .npz)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = setup_parser().parse_args()
+    generate_mining_schedule(args.mining_rates, args.run_time, args.seed).save(args.out)
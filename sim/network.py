@@ -1,76 +1,204 @@
 
-from typing import List, Generator, TYPE_CHECKING, Dict, Tuple, Optional, Set
+from typing import List, TYPE_CHECKING, Dict, Tuple, Optional, Sequence, Set, Union
+import numpy
 from .block import Block
-import simpy.events
-import simpy.core
-import simpy.exceptions
+from .context import SimulationContext
 if TYPE_CHECKING:
+    from .topology import Topology
     from .node import Node
+    from .engine import EventEngine
 
 
 class Network:
-    def __init__(self, env: simpy.core.Environment, download_log: Optional[Dict["Node", List[Tuple[Block, float, float]]]]) -> None:
+    """Connects the nodes of an experiment. Without a topology the network is a complete graph, and a header reaches each node
+    after the node's header delay. With a topology, it reaches each node after the delay of the shortest path from its sender,
+    except for the nodes with a header delay of 0 (the attackers), which hear every header at once in either case.
+
+    The network can be split into partitions: every node has an integer label, and headers only reach the nodes with the label of their sender."""
+
+    def __init__(self, context: SimulationContext, download_log: Optional[Dict["Node", List[Tuple[Block, float, float]]]],
+                 topology: Optional["Topology"] = None) -> None:
         self.__nodes: List[Node] = []
+        self.__index_of: Dict[Node, int] = {}
+        self.__topology = topology
+        # whether each node (by index) has a header delay of 0:
+        self.__is_instant = numpy.zeros(0, dtype=bool)
         self.__download_log = download_log
-        self.__env = env
-        self.__split: List[Node] = []
-        self.__split2: List[Node] = []
+        self.__context = context
+        self.__env = context.env
+        # the partition label of every node (by index), or None when the network is whole:
+        self.__labels: Optional[numpy.ndarray] = None
+
+        # recipients grouped by header delay, so that a broadcast is one event per distinct delay (and per partition, by label):
+        self.__nodes_by_delay: List[Tuple[float, List[Node]]] = []
+        self.__partitions_by_delay: Dict[int, List[Tuple[float, List[Node]]]] = {}
 
     def connect(self, node: "Node") -> None:
+        if self.__topology is not None and len(self.__nodes) >= self.__topology.num_nodes:
+            raise ValueError(
+                f"the topology has only {self.__topology.num_nodes} nodes")
+        self.__index_of[node] = len(self.__nodes)
         self.__nodes.append(node)
+        self.__is_instant = numpy.append(
+            self.__is_instant, node.header_delay == 0)
+        self.__nodes_by_delay = group_by_header_delay(self.__nodes)
         if self.__download_log is not None:
             self.__download_log[node] = []
 
+    def set_partition(self, labels: Optional[Sequence[int]]) -> None:
+        """splits the network into partitions by the label of every node (in the order they connected), or heals it (None).
+        Headers that were already sent still arrive."""
+        if labels is None:
+            self.__labels = None
+            self.__partitions_by_delay = {}
+            return
+        if len(labels) != len(self.__nodes):
+            raise ValueError(
+                f"a partition needs a label for each of the {len(self.__nodes)} nodes, got {len(labels)}")
+        self.__labels = numpy.asarray(labels, dtype=numpy.int64)
+        members: Dict[int, List[Node]] = {}
+        for node, label in zip(self.__nodes, self.__labels.tolist()):
+            members.setdefault(label, []).append(node)
+        self.__partitions_by_delay = {label: group_by_header_delay(nodes)
+                                      for label, nodes in members.items()}
+
     def induce_split(self, split: Set["Node"]) -> None:
-        self.__split = list(split)
-        self.__split2 = list(
-            node for node in self.__nodes if node not in split)
+        self.set_partition([int(node in split) for node in self.__nodes])
 
     def end_split(self) -> None:
-        self.__split = []
-        self.__split2 = []
+        self.set_partition(None)
 
     def schedule_notify_all_of_header(self, sender: "Node", block: Block) -> None:
-        nodes_to_notify = self.__nodes
-        if self.__split:
-            if sender in self.__split:
-                nodes_to_notify = self.__split
-            else:
-                nodes_to_notify = self.__split2
-
-        for node in nodes_to_notify:
-            if node is not sender:
-                def task(node: "Node", block: Block) -> Generator[simpy.events.Event, None, None]:
-                    yield self.__env.timeout(node.header_delay)
-                    node.receive_header(block)
-                self.__env.process(task(node, block))
+        for header_delay, nodes in self.__recipients_by_delay(sender):
+            def notify_all(nodes: List["Node"] = nodes) -> None:
+                for node in nodes:
+                    if node is not sender:
+                        node.receive_header(block)
+            self.__env.schedule(header_delay, notify_all)
+
+    def schedule_notify_all_of_headers(self, sender: "Node", blocks: List[Block]) -> None:
+        """announces a run of headers at once: every recipient gets all of them in one call (see Node.receive_headers)"""
+        for header_delay, nodes in self.__recipients_by_delay(sender):
+            def notify_all(nodes: List["Node"] = nodes) -> None:
+                for node in nodes:
+                    if node is not sender:
+                        node.receive_headers(blocks)
+            self.__env.schedule(header_delay, notify_all)
+
+    def __recipients_by_delay(self, sender: "Node") -> List[Tuple[float, List["Node"]]]:
+        if self.__topology is not None:
+            return self.__recipients_by_path_delay(sender)
+        if self.__labels is not None:
+            return self.__partitions_by_delay[int(self.__labels[self.__index_of[sender]])]
+        return self.__nodes_by_delay
+
+    def __recipients_by_path_delay(self, sender: "Node") -> List[Tuple[float, List["Node"]]]:
+        nodes = self.__nodes
+        sender_index = self.__index_of[sender]
+        groups = self.__topology.recipients_by_delay(  # type: ignore
+            sender_index)
+        is_instant = self.__is_instant
+        if is_instant.any():
+            # nodes with a header delay of 0 are not reached along the paths, they hear the header at once:
+            instant = numpy.flatnonzero(is_instant)
+            instant = instant[instant != sender_index]
+            groups = [(delay, indices[~is_instant[indices]])
+                      for delay, indices in groups]
+            if groups and groups[0][0] == 0:
+                instant = numpy.sort(numpy.concatenate(
+                    [instant, groups.pop(0)[1]]))
+            groups.insert(0, (0.0, instant))
+        labels = self.__labels
+        if labels is not None:
+            # in a partition, headers are only relayed within the sender's partition (along the same paths):
+            label = labels[sender_index]
+            groups = [(delay, indices[labels[indices] == label])
+                      for delay, indices in groups]
+        return [(delay, [nodes[index] for index in indices.tolist()])
+                for delay, indices in groups if len(indices)]
 
     def schedule_download_single_block(self, downloader: "Node", block: Block, bandwidth: float,
-                                       fraction_already_dled: float) -> simpy.events.Process:
+                                       fraction_already_dled: float) -> "BlockDownload":
         if not block.is_available:
             raise ValueError(f"block is not available! {block}")
 
-        def download_task() -> Generator[simpy.events.Event, None, None]:
-            if bandwidth <= 0:
-                time_to_download = 0.0
-            else:
-                time_to_download = (1-fraction_already_dled)/bandwidth
-            start_time = self.__env.now
-            try:
-                yield self.__env.timeout(time_to_download)
-                downloader.download_complete(block)
-            except simpy.exceptions.Interrupt as i:
-                elapsed_time = self.__env.now - start_time
-                fraction_downloaded = elapsed_time*bandwidth + fraction_already_dled
-                downloader.download_interrupted(block, fraction_downloaded)
-            finally:
-                if self.__download_log:
-                    end_time = self.__env.now
-                    self.__download_log[downloader].append(
-                        (block, float(start_time), float(end_time)))
-
-        return self.__env.process(download_task())
+        return BlockDownload(self.__env, downloader, block, bandwidth, fraction_already_dled, self.__download_log)
+
+    @property
+    def context(self) -> SimulationContext:
+        return self.__context
 
     @property
     def download_log(self) -> Optional[Dict["Node", List[Tuple[Block, float, float]]]]:
         return self.__download_log
+
+
+class BlockDownload:
+    """A block download in progress. Completion is a timer callback on the event engine, 
+    and cancelling it computes the downloaded fraction from the elapsed time and drops the timer."""
+
+    def __init__(self, env: "EventEngine", downloader: "Node", block: Block, bandwidth: float,
+                 fraction_already_dled: float, download_log: Optional[Dict["Node", List[Tuple[Block, float, float]]]]) -> None:
+        self.__env = env
+        self.__downloader = downloader
+        self.__block = block
+        self.__bandwidth = bandwidth
+        self.__fraction_already_dled = fraction_already_dled
+        self.__download_log = download_log
+        self.__start_time = env.now
+        self.__is_alive = True
+
+        if bandwidth <= 0:
+            # without a bandwidth limit, the download completes at once (after the callbacks already scheduled for now):
+            env.schedule_now(self.__complete)
+        else:
+            env.schedule((1-fraction_already_dled)/bandwidth, self.__complete)
+
+    @property
+    def block(self) -> Block:
+        return self.__block
+
+    @property
+    def is_alive(self) -> bool:
+        return self.__is_alive
+
+    def __complete(self) -> None:
+        if not self.__is_alive:
+            return
+        self.__finish()
+        self.__downloader.download_complete(self.__block)
+
+    def cancel(self) -> None:
+        """stops the download. The downloader is notified of the fraction of the block it has downloaded so far."""
+        if not self.__is_alive:
+            return
+        self.__finish()
+        elapsed_time = self.__env.now - self.__start_time
+        fraction_downloaded = elapsed_time*self.__bandwidth + self.__fraction_already_dled
+        self.__downloader.download_interrupted(self.__block, fraction_downloaded)
+
+    def __finish(self) -> None:
+        self.__is_alive = False
+        if self.__download_log:
+            end_time = self.__env.now
+            self.__download_log[self.__downloader].append(
+                (self.__block, float(self.__start_time), float(end_time)))
+
+
+def partition_labels(assignment: Union[None, int, Sequence[int]], num_nodes: int) -> Optional[List[int]]:
+    """the labels of a partition: None (the network is whole), the number of contiguous, equally large partitions
+    (2 splits off the first half of the nodes), or a label for every node"""
+    if assignment is None:
+        return None
+    if isinstance(assignment, int):
+        bounds = [part * num_nodes // assignment for part in range(1, assignment)]
+        return numpy.searchsorted(bounds, numpy.arange(num_nodes), side="right").tolist()
+    return [int(label) for label in assignment]
+
+
+def group_by_header_delay(nodes: List["Node"]) -> List[Tuple[float, List["Node"]]]:
+    """groups the nodes by their header delay, keeping the original order of the nodes within each group"""
+    groups: Dict[float, List["Node"]] = {}
+    for node in nodes:
+        groups.setdefault(node.header_delay, []).append(node)
+    return list(groups.items())
@@ -1,24 +1,31 @@
 
 from abc import ABC
-from typing import Set, ClassVar, Optional
+from typing import Optional, List, TYPE_CHECKING
 from .block import Block
 import sim.network as network
-import simpy.events
-import simpy.core
 import logging
+import array
+import bisect
 import pylru  # type: ignore
 import json
+if TYPE_CHECKING:
+    from .network import BlockDownload
 
 
 class Node(ABC):
-    __next_id: ClassVar[int] = 0
-    env: simpy.core.Environment
+    # nodes that withhold their blocks mine them unavailable (they can release them later):
+    _withholds_blocks = False
 
     def __init__(self, genesis: Block, mining_rate: float, bandwidth: float, header_delay: float,
                  network: network.Network, partial_block_cache_size: int = 10) -> None:
+        # the experiment this node takes part in:
+        self._context = network.context
+        self._env = self._context.env
+        self.__log_events = self._context.log_events
+        self.__log_blocks = self._context.log_blocks
+
         # set a unique id:
-        self.__id = Node.__next_id
-        Node.__next_id += 1
+        self.__id = self._context.allocate_node_id()
         self.__hash = hash(self.__id)
         self.__description = f"{self.__class__.__name__}_{self.id}"
 
@@ -34,9 +41,14 @@ class Node(ABC):
         self._mining_target = genesis
 
         # download management:
-        self.__download_process: Optional[simpy.events.Process] = None
+        self.__download: Optional["BlockDownload"] = None
         self.__download_target: Optional[Block] = None
-        self._downloaded_blocks: Set[Block] = {genesis}
+        # the downloaded blocks, as a flag per block id from __base_id on (ids are dense, so this takes about a byte per block).
+        # Pruning moves the base up to the watermark, and the ids of the downloaded side branch blocks below it are kept in order:
+        self.__downloaded = bytearray()
+        self.__base_id = 0
+        self.__downloaded_below = array.array("i")
+        self.__add_downloaded(genesis)
 
         self._partial_blocks = pylru.lrucache(partial_block_cache_size)
 
@@ -63,48 +75,143 @@ class Node(ABC):
     def __str__(self) -> str:
         return self.__description
 
+    def retained_blocks(self) -> List[Block]:
+        """the blocks this node may still build on or walk back from. Pruning keeps a common ancestor of all of them."""
+        return [self._mining_target]
+
+    def release_final_blocks(self, blocks: List[Block]) -> None:
+        """called after pruning with final blocks that no side branch forks from, which nodes never walk back to.
+        The flags of the blocks linked before the watermark are dropped. Those that were downloaded are final,
+        or on side branches that forked below the watermark, and only the ids of the latter are kept (4 bytes each)."""
+        watermark = self._context.watermark
+        if watermark is None or watermark.id <= self.__base_id:
+            return
+        released = {block.id for block in blocks}
+        dropped = self.__downloaded[:watermark.id - self.__base_id]
+        index = dropped.find(1)
+        while index >= 0:
+            if self.__base_id + index not in released:
+                self.__downloaded_below.append(self.__base_id + index)
+            index = dropped.find(1, index + 1)
+        del self.__downloaded[:watermark.id - self.__base_id]
+        self.__base_id = watermark.id
+
+    def _has_downloaded(self, block: Block) -> bool:
+        """final blocks are ancestors of every chain that the nodes build on, so they count as downloaded too"""
+        index = block.id - self.__base_id
+        if 0 <= index < len(self.__downloaded):
+            return self.__downloaded[index] == 1 or block.is_final
+        # (blocks linked before the watermark or after the flags last grew, and copies that are not materialized, with an id of -1)
+        if block.is_final:
+            return True
+        below = self.__downloaded_below
+        position = bisect.bisect_left(below, block.id)
+        return position < len(below) and below[position] == block.id
+
+    def __add_downloaded(self, block: Block) -> None:
+        downloaded = self.__downloaded
+        index = block.id - self.__base_id
+        if index < 0:
+            # (a side branch block that was linked before the watermark)
+            bisect.insort(self.__downloaded_below, block.id)
+            return
+        if index >= len(downloaded):
+            # (grown by doubling, so that adding a block takes amortized constant time)
+            downloaded.extend(bytes(max(index + 1, 2 * len(downloaded)) - len(downloaded)))
+        downloaded[index] = 1
+
+    def _lowest_missing_ancestor(self, block: Block, downloaded_height: Optional[int] = None) -> Block:
+        """the lowest ancestor of a block that this node has not downloaded (the block itself if its parent is downloaded).
+        Downloads extend downloaded parents, so the downloaded ancestors of a block are exactly those below some height.
+        That height is found by galloping down in doubling steps and bisecting, rather than walking the missing branch.
+        downloaded_height, if given, is the height of an ancestor that is known to be downloaded, and the search starts just above it."""
+        parent = block.parent
+        # most of the time, only the block itself is missing:
+        if parent is None or self._has_downloaded(parent):
+            return block
+
+        missing = parent
+        if downloaded_height is not None:
+            probe = missing.ancestor(downloaded_height + 1)
+            if not self._has_downloaded(probe):
+                return probe
+        else:
+            step = 2
+            while True:
+                probe = missing.ancestor(max(missing.height - step, 0))
+                if self._has_downloaded(probe):
+                    break
+                missing = probe
+                step *= 2
+
+        # missing is not downloaded and probe is, bisect the heights between them:
+        downloaded_height = probe.height
+        while missing.height - downloaded_height > 1:
+            probe = missing.ancestor((missing.height + downloaded_height) // 2)
+            if self._has_downloaded(probe):
+                downloaded_height = probe.height
+            else:
+                missing = probe
+        return missing
+
     def mine_block(self) -> Block:
         """This method is called externally by the mining oracle.
         the block is mined on top of the current mining target, and the mining target is adjusted to the new block"""
         block = Block(self, self._mining_target,
-                      Node.env.now)
-        message = f"Mining t={Node.env.now:.2f}: Node {self} mines block {block}"
-        logging.getLogger("SIM_INFO").info(message)
-
-        assert block.miner is not None
-        assert block.parent is not None
-        details = {"creation_time": block.creation_time, "miner": block.miner.id,
-                   "parent": block.parent.id, "height": block.height, "block_id": block.id}
-        logging.getLogger("BLOCK_LOG").info(json.dumps(details))
-        self._downloaded_blocks.add(block)
+                      self._env.now, self._context, is_available=not self._withholds_blocks)
+        if self.__log_events:
+            message = f"Mining t={self._env.now:.2f}: Node {self} mines block {block}"
+            logging.getLogger("SIM_INFO").info(message)
+
+        if self.__log_blocks:
+            assert block.miner is not None
+            assert block.parent is not None
+            details = {"creation_time": block.creation_time, "miner": block.miner.id,
+                       "parent": block.parent.label, "height": block.height, "block_id": block.label}
+            logging.getLogger("BLOCK_LOG").info(json.dumps(details))
+        self.__add_downloaded(block)
         self._mining_target = block
         return block
 
     def receive_header(self, block: Block) -> None:
-        message = f"Header t={Node.env.now:.2f}: Node {self} learns of header {block}"
-        logging.getLogger("SIM_INFO").info(message)
+        if self.__log_events:
+            message = f"Header t={self._env.now:.2f}: Node {self} learns of header {block}"
+            logging.getLogger("SIM_INFO").info(message)
 
     def _broadcast_header(self, block: Block) -> None:
         self.__network.schedule_notify_all_of_header(self, block)
 
+    def receive_headers(self, blocks: List[Block]) -> None:
+        """receives a batch of headers that were announced together (in order). 
+        Nodes that can decide what to download once per batch override this."""
+        for block in blocks:
+            self.receive_header(block)
+
+    def _broadcast_headers(self, blocks: List[Block]) -> None:
+        if blocks:
+            self.__network.schedule_notify_all_of_headers(self, blocks)
+
     def _stop_cur_download_and_start_new_one(self, block: Optional[Block]) -> None:
         """This methods interrupts any current download and starts a new block download."""
         # if this is the same target, do nothing (keep downloading it)
         if self.__download_target == block:
             return
 
-        # interrupt the old process if it exists
-        if self.__download_process:
-            self.__download_process.interrupt()
-            self.__download_process = None
+        fraction_already_dled = 0
+        if block is not None and block in self._partial_blocks:
+            fraction_already_dled = self._partial_blocks[block]
+
+        # cancel the old download if it exists
+        if self.__download:
+            self.__download.cancel()
+            self.__download = None
 
         self.__download_target = block
         # schedule a new download.
         if block is not None:
-            fraction_already_dled = 0
-            if block in self._partial_blocks:
-                fraction_already_dled = self._partial_blocks[block]
-            self.__download_process = self.__network.schedule_download_single_block(
+            # (a copy becomes a real block once it is downloaded, see EquivocatedCopies)
+            block.materialize()
+            self.__download = self.__network.schedule_download_single_block(
                 self, block, self.bandwidth, fraction_already_dled)
 
     def __hash__(self) -> int:
@@ -112,15 +219,17 @@ class Node(ABC):
 
     def download_complete(self, block: Block) -> None:
         """Method that is called when dowloading a block is finished. The mining target is re-adjusted if the current downloaded chain is longest"""
-        # finish off the current download process.
-        self.__download_process = None
+        # finish off the current download.
+        self.__download = None
         self.__download_target = None
 
-        message = f"Download Complete t={Node.env.now:.2f}: Node {self} downloaded block {block}"
-        logging.getLogger("SIM_INFO").info(message)
+        if self.__log_events:
+            message = f"Download Complete t={self._env.now:.2f}: Node {self} downloaded block {block}"
+            logging.getLogger("SIM_INFO").info(message)
 
-        # add block to download store:
-        self._downloaded_blocks.add(block)
+        # add block to download store (nodes that receive blocks without downloading them, like SPV nodes, materialize copies here):
+        block.materialize()
+        self.__add_downloaded(block)
         if block in self._partial_blocks:
             del self._partial_blocks[block]
 
@@ -128,8 +237,9 @@ class Node(ABC):
             self._mining_target = block
 
     def download_interrupted(self, block: Block, cummulative_fraction_downloaded: float) -> None:
-        message = f"Download Interrupt t={Node.env.now:.2f}: Node {self} downloaded block {block}, fraction: {cummulative_fraction_downloaded}"
-        logging.getLogger("SIM_INFO").info(message)
+        if self.__log_events:
+            message = f"Download Interrupt t={self._env.now:.2f}: Node {self} downloaded block {block}, fraction: {cummulative_fraction_downloaded}"
+            logging.getLogger("SIM_INFO").info(message)
 
         self._partial_blocks[block] = cummulative_fraction_downloaded
         # TODO handle partial downloads here. Currently partial downloads are discarded.
@@ -0,0 +1,638 @@
+from typing import Callable, List, Sequence, Tuple, Union
+import json
+import logging
+import numpy
+
+from .block import Block
+from .configuration import RunConfig, DownloadRules
+from .context import SimulationContext
+
+
+def check_population_config(run_config: RunConfig) -> None:
+    """a population simulates honest PoW nodes that follow the longest header chain rule,
+    in a network with no attackers, SPV nodes or splits."""
+    unsupported = []
+    if run_config.mode != "pow":
+        unsupported.append(f"mode {run_config.mode}")
+    if run_config.download_rule != DownloadRules.LongestHeaderChain.value:
+        unsupported.append(f"the {run_config.download_rule} download rule")
+    if run_config.dumb_attacker or run_config.private_attacker or \
+            run_config.teasing_attacker or run_config.equivocation_teasing_attacker:
+        unsupported.append("attackers")
+    if run_config.num_spv:
+        unsupported.append("SPV nodes")
+    if run_config.induce_split or run_config.partition_schedule:
+        unsupported.append("network splits")
+    if run_config.topology:
+        unsupported.append("a topology")
+    if run_config.plot:
+        unsupported.append("plots")
+    if unsupported:
+        raise ValueError(
+            f"A node population does not support {', '.join(unsupported)}")
+
+
+class NodePopulation:
+    """Honest nodes that follow the longest header chain rule, with the state of all of them in parallel numpy arrays
+    (one row per node), so that very large networks fit in memory and a header is handled for all of its recipients in one step.
+    HonestNodeLongestHeaderChain is the reference implementation: given the same blocks, the nodes of a population
+    make the same downloads and mine on the same blocks. Node events other than mining are not logged.
+
+    Blocks get columns (slots) in the order in which they are mined. The downloaded blocks of the nodes are a boolean matrix,
+    and their download queues (the top buffer_size headers) and partial downloads are rows of fixed width.
+    The entries of a queue are packed at the start of its row, and the column of its top entry is kept up to date.
+    After pruning, the columns of final blocks are dropped, and a slot of -1 stands for a final block (which every node has).
+
+    With merge_classes, a row is a class of nodes that hold exactly the same view (see __view), with a count of its members.
+    The members of a class receive the same headers and make the same downloads, so they are simulated once.
+    A node that mines a block leaves its class (the row is copied), and rejoins it when their views are the same again,
+    which is checked only for the rows that were split off. So the work is proportional to the number of distinct views
+    rather than the number of nodes."""
+
+    # queue priorities are height * __SEQ_RANGE - seq: the highest, then the earliest header is on top.
+    __SEQ_RANGE = 1 << 32
+
+    def __init__(self, genesis: Block, num_nodes: int, mining_rate: float, bandwidth: Union[float, Sequence[float]],
+                 header_delay: Union[float, Sequence[float]], context: SimulationContext,
+                 buffer_size: int = 100, partial_block_cache_size: int = 10, initial_capacity: int = 1024,
+                 merge_classes: bool = False) -> None:
+        self.__context = context
+        self.__env = context.env
+        self.__log_events = context.log_events
+        self.__log_blocks = context.log_blocks
+        self.__mining_rate = mining_rate
+        self.__bandwidth = numpy.broadcast_to(
+            numpy.asarray(bandwidth, dtype=numpy.float64), (num_nodes,)).copy()
+        self.__header_delay = numpy.broadcast_to(
+            numpy.asarray(header_delay, dtype=numpy.float64), (num_nodes,)).copy()
+        self.__members = [PopulationNode(self, index, context.allocate_node_id())
+                          for index in range(num_nodes)]
+
+        # the header delays in order of the first node with each delay, so that a header is one event per delay:
+        delays, first_rows = numpy.unique(
+            self.__header_delay, return_index=True)
+        self.__delays = [float(delays[group])
+                         for group in numpy.argsort(first_rows)]
+
+        # the row of every node, and the number of nodes in every row. Unused rows are free:
+        self.__class_of = numpy.arange(num_nodes)
+        if merge_classes:
+            # the nodes start out with the same view, unless their bandwidths or header delays differ:
+            _, first_nodes, key_of_node = numpy.unique(numpy.stack([self.__bandwidth, self.__header_delay], axis=1),
+                                                       axis=0, return_index=True, return_inverse=True)
+            self.__class_of = first_nodes[key_of_node.ravel()]
+        self.__class_sizes = numpy.bincount(
+            self.__class_of, minlength=num_nodes)
+        self.__free_rows: List[int] = numpy.flatnonzero(
+            self.__class_sizes == 0).tolist()
+        # the row that each row was split off (or -1), and the rows that were split off and have not rejoined yet:
+        self.__origins = numpy.full(num_nodes, -1)
+        self.__split_rows: List[int] = []
+
+        # the blocks, by slot:
+        self.__num_slots = 0
+        self.__blocks: List[Block] = []
+        self.__block_ids = numpy.zeros(initial_capacity, dtype=numpy.int64)
+        self.__heights = numpy.zeros(initial_capacity, dtype=numpy.int64)
+        self.__parents = numpy.full(initial_capacity, -1, dtype=numpy.int64)
+        self.__skips = numpy.full(initial_capacity, -1, dtype=numpy.int64)
+        self.__downloaded = numpy.zeros(
+            (num_nodes, initial_capacity), dtype=bool)
+        self.__watermark_id = -1
+
+        genesis_slot = self.__add_slot(genesis)
+        self.__downloaded[:, genesis_slot] = True
+        self.__mining_targets = numpy.full(
+            num_nodes, genesis_slot, dtype=numpy.int64)
+
+        # download queues (an entry with priority -1 is empty):
+        self.__queue_slots = numpy.zeros(
+            (num_nodes, buffer_size), dtype=numpy.int64)
+        self.__queue_priorities = numpy.full(
+            (num_nodes, buffer_size), -1, dtype=numpy.int64)
+        self.__queue_sizes = numpy.zeros(num_nodes, dtype=numpy.int64)
+        self.__queue_tops = numpy.zeros(num_nodes, dtype=numpy.int64)
+        self.__queue_seq = 0
+
+        # current downloads (a target of -1 is no download). Every download gets a ticket, which tells it from the ones it replaced
+        # (a row that is copied keeps the ticket, and the download completes for both rows):
+        self.__download_targets = numpy.full(num_nodes, -1, dtype=numpy.int64)
+        self.__download_start_times = numpy.zeros(num_nodes)
+        self.__download_fractions = numpy.zeros(num_nodes)
+        self.__download_tickets = numpy.zeros(num_nodes, dtype=numpy.int64)
+        self.__next_ticket = 1
+
+        # partially downloaded blocks, least recently used first out (an entry with stamp 0 is empty):
+        self.__partial_counts = numpy.zeros(num_nodes, dtype=numpy.int64)
+        self.__partial_slots = numpy.full(
+            (num_nodes, partial_block_cache_size), -1, dtype=numpy.int64)
+        self.__partial_fractions = numpy.zeros(
+            (num_nodes, partial_block_cache_size))
+        self.__partial_stamps = numpy.zeros(
+            (num_nodes, partial_block_cache_size), dtype=numpy.int64)
+        self.__partial_stamp = 0
+
+    @property
+    def members(self) -> List["PopulationNode"]:
+        return self.__members[:]
+
+    @property
+    def mining_rate(self) -> float:
+        return self.__mining_rate
+
+    def __len__(self) -> int:
+        return len(self.__members)
+
+    @property
+    def num_classes(self) -> int:
+        """the number of distinct views (rows in use)"""
+        return len(self.__members) - len(self.__free_rows)
+
+    def mining_target(self, index: int) -> Block:
+        return self.__blocks[self.__mining_targets[self.__class_of[index]]]
+
+    def mine_block(self, index: int) -> Block:
+        """the node mines on its mining target and announces the block to all other nodes"""
+        member = self.__members[index]
+        block = Block(member, self.mining_target(index),
+                      self.__env.now, self.__context)
+        if self.__log_events:
+            message = f"Mining t={self.__env.now:.2f}: Node {member} mines block {block}"
+            logging.getLogger("SIM_INFO").info(message)
+
+        if self.__log_blocks:
+            assert block.parent is not None
+            details = {"creation_time": block.creation_time, "miner": member.id,
+                       "parent": block.parent.label, "height": block.height, "block_id": block.label}
+            logging.getLogger("BLOCK_LOG").info(json.dumps(details))
+
+        row = self.__leave_class(index)
+        slot = self.__add_slot(block)
+        self.__downloaded[row, slot] = True
+        self.__mining_targets[row] = slot
+
+        for header_delay in self.__delays:
+            self.__env.schedule(
+                header_delay, self.__header_arrival(header_delay, index, block))
+        self.__reconsider_downloads(numpy.array([row]))
+        return block
+
+    def receive_block(self, block: Block) -> None:
+        """announces a block that was mined outside the population (by the nodes of another partition of a parallel run):
+        its header reaches the nodes with each header delay that long after the block was mined"""
+        self.__add_slot(block)
+        for header_delay in self.__delays:
+            self.__env.schedule_at(block.creation_time + header_delay,
+                                   self.__header_arrival(header_delay, -1, block))
+
+    def release_final_blocks(self) -> None:
+        """drops the columns of the blocks that became final since the last call (see SimulationContext.prune)"""
+        watermark = self.__context.watermark
+        if watermark is None or watermark.id == self.__watermark_id:
+            return
+        self.__watermark_id = watermark.id
+
+        is_final = numpy.zeros(self.__num_slots, dtype=bool)
+        slot = self.__parents[self.__slot_of(watermark)]
+        while slot >= 0:
+            is_final[slot] = True
+            slot = self.__parents[slot]
+        if is_final.any():
+            self.__compact(~is_final)
+
+    def __leave_class(self, index: int) -> int:
+        """moves the node to a row of its own (a copy of its class), and returns the row"""
+        row = int(self.__class_of[index])
+        if self.__class_sizes[row] == 1:
+            return row
+        new_row = self.__free_rows.pop()
+        for array in (self.__bandwidth, self.__header_delay, self.__downloaded, self.__mining_targets,
+                      self.__queue_slots, self.__queue_priorities, self.__queue_sizes, self.__queue_tops,
+                      self.__download_targets, self.__download_start_times, self.__download_fractions, self.__download_tickets,
+                      self.__partial_counts, self.__partial_slots, self.__partial_fractions, self.__partial_stamps):
+            array[new_row] = array[row]
+        self.__class_sizes[row] -= 1
+        self.__class_sizes[new_row] = 1
+        self.__class_of[index] = new_row
+        self.__origins[new_row] = row
+        self.__split_rows.append(new_row)
+        return new_row
+
+    def __rejoin_classes(self) -> None:
+        """merges every row that was split off a class back into it once their views are the same again
+        (typically when the rest of the class has downloaded the block that its miner mined)"""
+        if not self.__split_rows:
+            return
+        rows = numpy.array(self.__split_rows)
+        origins = self.__origins[rows]
+        # only the rows that agree with their class on a few numbers and on their downloaded blocks are compared in full:
+        same = ((self.__mining_targets[rows] == self.__mining_targets[origins]) &
+                (self.__download_targets[rows] == self.__download_targets[origins]) &
+                (self.__queue_sizes[rows] == self.__queue_sizes[origins]) &
+                (self.__partial_counts[rows] == self.__partial_counts[origins]) &
+                (self.__top_slots(rows) == self.__top_slots(origins)))
+        rows, origins = rows[same], origins[same]
+        same = (self.__downloaded[rows, :self.__num_slots] ==
+                self.__downloaded[origins, :self.__num_slots]).all(axis=1)
+        candidates = rows[same]
+        for row in candidates.tolist():
+            origin = int(self.__origins[row])
+            if self.__view(row) != self.__view(origin):
+                continue
+            self.__class_of[self.__class_of == row] = origin
+            self.__class_sizes[origin] += self.__class_sizes[row]
+            self.__class_sizes[row] = 0
+            self.__free_rows.append(row)
+            # the rows that were split off this one belong to its class now:
+            self.__origins[self.__origins == row] = origin
+            self.__origins[row] = -1
+            self.__split_rows.remove(row)
+
+    def __top_slots(self, rows: numpy.ndarray) -> numpy.ndarray:
+        """the slot of the top entry of each queue (or -1 for an empty queue)"""
+        return numpy.where(self.__queue_sizes[rows] > 0, self.__queue_slots[rows, self.__queue_tops[rows]], -1)
+
+    def __view(self, row: int) -> Tuple:
+        """everything that the future downloads of a node depend on: its downloaded blocks, its mining target, the order of its queue,
+        its current download and its partial downloads (in the order of their last use)"""
+        queue_size = self.__queue_sizes[row]
+        queue_order = numpy.argsort(-self.__queue_priorities[row, :queue_size])
+        is_partial = self.__partial_stamps[row] > 0
+        partial_order = numpy.argsort(self.__partial_stamps[row][is_partial])
+        download: Tuple = (-1,)
+        if self.__download_targets[row] >= 0:
+            download = (self.__download_targets[row], self.__download_start_times[row],
+                        self.__download_fractions[row])
+        return (self.__bandwidth[row], self.__header_delay[row], self.__mining_targets[row], download,
+                self.__queue_slots[row, :queue_size][queue_order].tobytes(),
+                self.__partial_slots[row][is_partial][partial_order].tobytes(),
+                self.__partial_fractions[row][is_partial][partial_order].tobytes(),
+                self.__downloaded[row, :self.__num_slots].tobytes())
+
+    def __header_arrival(self, header_delay: float, miner: int, block: Block) -> Callable[[], None]:
+        def receive_header() -> None:
+            # the recipients are found when the header arrives, since rows may have been copied in the meantime.
+            # (the miner's row holds only the miner until the others have its block. A block from outside has a miner of -1)
+            rows = numpy.flatnonzero(
+                (self.__class_sizes > 0) & (self.__header_delay == header_delay))
+            if miner >= 0:
+                rows = rows[rows != self.__class_of[miner]]
+            if not len(rows):
+                return
+            self.__enqueue(rows, self.__slot_of(block), block.height)
+            self.__reconsider_downloads(rows)
+            self.__rejoin_classes()
+        return receive_header
+
+    def __download_completion(self, tickets: numpy.ndarray) -> Callable[[], None]:
+        def complete_downloads() -> None:
+            # downloads that were interrupted in the meantime do not complete:
+            completed = numpy.flatnonzero(numpy.isin(self.__download_tickets, tickets) &
+                                          (self.__download_targets >= 0) & (self.__class_sizes > 0))
+            if not len(completed):
+                return
+            blocks = self.__download_targets[completed]
+            self.__download_targets[completed] = -1
+            self.__downloaded[completed, blocks] = True
+            self.__drop_partial(completed, blocks)
+
+            higher = self.__heights[blocks] > self.__heights[self.__mining_targets[completed]]
+            self.__mining_targets[completed[higher]] = blocks[higher]
+            self.__reconsider_downloads(completed)
+            self.__rejoin_classes()
+        return complete_downloads
+
+    def __reconsider_downloads(self, rows: numpy.ndarray) -> None:
+        self.__start_downloads(rows, self.__find_download_targets(rows))
+
+    def __find_download_targets(self, rows: numpy.ndarray) -> numpy.ndarray:
+        """the lowest missing ancestor of the top of each queue (or -1 for an empty queue). Downloaded headers are dequeued on the way."""
+        targets = numpy.full(len(rows), -1, dtype=numpy.int64)
+        pending = numpy.arange(len(rows))
+        while len(pending):
+            pending = pending[self.__queue_sizes[rows[pending]] > 0]
+            pending_rows = rows[pending]
+            tops = self.__queue_slots[pending_rows,
+                                      self.__queue_tops[pending_rows]]
+            is_downloaded = self.__has_downloaded(pending_rows, tops)
+            self.__dequeue(pending_rows[is_downloaded])
+            is_missing = ~is_downloaded
+            targets[pending[is_missing]] = self.__lowest_missing_ancestors(
+                pending_rows[is_missing], tops[is_missing])
+            pending = pending[is_downloaded]
+        return targets
+
+    def __start_downloads(self, rows: numpy.ndarray, targets: numpy.ndarray) -> None:
+        """interrupts the current download of every node whose target changed, and starts downloading the new target"""
+        is_changed = self.__download_targets[rows] != targets
+        rows, targets = rows[is_changed], targets[is_changed]
+        if not len(rows):
+            return
+        has_target = targets >= 0
+        fractions = numpy.zeros(len(rows))
+        fractions[has_target] = self.__take_partial(
+            rows[has_target], targets[has_target])
+
+        current_targets = self.__download_targets[rows]
+        is_downloading = current_targets >= 0
+        interrupted = rows[is_downloading]
+        elapsed_times = self.__env.now - \
+            self.__download_start_times[interrupted]
+        self.__store_partial(interrupted, current_targets[is_downloading],
+                             elapsed_times*self.__bandwidth[interrupted] + self.__download_fractions[interrupted])
+
+        self.__download_targets[rows] = targets
+        rows, fractions = rows[has_target], fractions[has_target]
+        self.__download_start_times[rows] = self.__env.now
+        self.__download_fractions[rows] = fractions
+        tickets = self.__next_ticket + numpy.arange(len(rows))
+        self.__next_ticket += len(rows)
+        self.__download_tickets[rows] = tickets
+
+        # downloads that complete at the same time complete in one event:
+        bandwidths = self.__bandwidth[rows]
+        is_instant = bandwidths <= 0
+        if is_instant.any():
+            self.__env.schedule_now(
+                self.__download_completion(tickets[is_instant]))
+        is_timed = ~is_instant
+        tickets = tickets[is_timed]
+        times_to_download = (1-fractions[is_timed])/bandwidths[is_timed]
+        delays, group_of_row = numpy.unique(
+            times_to_download, return_inverse=True)
+        for group, delay in enumerate(delays):
+            in_group = group_of_row == group
+            self.__env.schedule(
+                float(delay), self.__download_completion(tickets[in_group]))
+
+    def __has_downloaded(self, rows: numpy.ndarray, slots: numpy.ndarray) -> numpy.ndarray:
+        return (slots < 0) | self.__downloaded[rows, numpy.maximum(slots, 0)]
+
+    def __lowest_missing_ancestors(self, rows: numpy.ndarray, tips: numpy.ndarray) -> numpy.ndarray:
+        """the lowest ancestor of each tip that the node has not downloaded (the tips are not downloaded).
+        Downloads extend downloaded parents, so the downloaded ancestors of a tip are those below some height.
+        That height is found by galloping down in doubling steps and bisecting, as in Node._lowest_missing_ancestor."""
+        result = tips.copy()
+        parents = self.__parents[tips]
+        search = numpy.flatnonzero(~self.__has_downloaded(rows, parents))
+        if not len(search):
+            return result
+        rows = rows[search]
+        missing = parents[search]
+        downloaded_heights = numpy.full(len(search), -1, dtype=numpy.int64)
+
+        step = 2
+        active = numpy.arange(len(search))
+        while len(active):
+            heights = numpy.maximum(self.__heights[missing[active]] - step, 0)
+            probes = self.__ancestors(missing[active], heights)
+            is_downloaded = self.__has_downloaded(rows[active], probes)
+            downloaded_heights[active[is_downloaded]] = heights[is_downloaded]
+            missing[active[~is_downloaded]] = probes[~is_downloaded]
+            active = active[~is_downloaded]
+            step *= 2
+
+        active = numpy.flatnonzero(
+            self.__heights[missing] - downloaded_heights > 1)
+        while len(active):
+            heights = (self.__heights[missing[active]] +
+                       downloaded_heights[active]) // 2
+            probes = self.__ancestors(missing[active], heights)
+            is_downloaded = self.__has_downloaded(rows[active], probes)
+            downloaded_heights[active[is_downloaded]] = heights[is_downloaded]
+            missing[active[~is_downloaded]] = probes[~is_downloaded]
+            active = active[self.__heights[missing[active]] -
+                            downloaded_heights[active] > 1]
+
+        result[search] = missing
+        return result
+
+    def __ancestors(self, slots: numpy.ndarray, heights: numpy.ndarray) -> numpy.ndarray:
+        """the ancestor of each block at the given height, with the skip pointers of Block.ancestor (-1 for final ancestors)"""
+        result = slots.copy()
+        active = numpy.flatnonzero(self.__heights[slots] > heights)
+        while len(active):
+            blocks = result[active]
+            targets = heights[active]
+            skips = self.__skips[blocks]
+            skip_heights = numpy.where(
+                skips >= 0, self.__heights[numpy.maximum(skips, 0)], -1)
+            prev_skip_heights = _skip_heights(self.__heights[blocks] - 1)
+            take_skip = (skip_heights == targets) | ((skip_heights > targets) &
+                                                     ~((prev_skip_heights < skip_heights - 2) & (prev_skip_heights >= targets)))
+            blocks = numpy.where(take_skip, skips, self.__parents[blocks])
+            result[active] = blocks
+            active = active[(blocks >= 0) & (
+                self.__heights[numpy.maximum(blocks, 0)] > targets)]
+        return result
+
+    def __enqueue(self, rows: numpy.ndarray, slot: int, height: int) -> None:
+        """LimittedQueue.enqueue for every row: when a full queue takes the new entry, the top entry of every lower height
+        becomes the latest of its height, and the top entry of the lowest height is evicted"""
+        self.__queue_seq += 1
+        priority = height * self.__SEQ_RANGE - self.__queue_seq
+        columns = self.__queue_sizes[rows]
+        is_full = columns == self.__queue_priorities.shape[1]
+        full_rows = rows[is_full]
+        if len(full_rows):
+            priorities = self.__queue_priorities[full_rows]
+            heights = -(-priorities // self.__SEQ_RANGE)
+            lowest = heights.min(axis=1)
+            columns[is_full] = numpy.where(
+                heights == lowest[:, None], priorities, -1).argmax(axis=1)
+            is_taken = lowest < height
+            self.__step_down(full_rows[is_taken], priorities[is_taken],
+                             heights[is_taken], lowest[is_taken], height)
+            is_kept = ~is_full
+            is_kept[is_full] = is_taken
+            rows, columns, is_full = rows[is_kept], columns[is_kept], is_full[is_kept]
+        self.__queue_priorities[rows, columns] = priority
+        self.__queue_slots[rows, columns] = slot
+        self.__queue_sizes[rows[~is_full]] += 1
+
+        # (an evicted entry is never the top, unless the new entry replaces it as the top)
+        is_top = self.__queue_priorities[rows,
+                                         self.__queue_tops[rows]] < priority
+        is_top |= self.__queue_sizes[rows] == 1
+        self.__queue_tops[rows[is_top]] = columns[is_top]
+
+    def __step_down(self, rows: numpy.ndarray, priorities: numpy.ndarray, heights: numpy.ndarray,
+                    lowest: numpy.ndarray, height: int) -> None:
+        """the top entry of every height between the lowest height of a full row and a new entry of the given height
+        becomes the latest entry of its height (priorities and heights are the rows' entries)"""
+        if not len(rows):
+            return
+        order = priorities.argsort(axis=1)
+        heights = numpy.take_along_axis(heights, order, axis=1)
+        # in ascending order, the top entry of a height is the last one, and the height has other entries if the previous one has it:
+        is_tied_top = numpy.zeros(heights.shape, dtype=bool)
+        is_tied_top[:, 1:] = heights[:, 1:] == heights[:, :-1]
+        is_tied_top[:, 1:-1] &= heights[:, 1:-1] != heights[:, 2:]
+        is_tied_top &= (heights > lowest[:, None]) & (heights < height)
+        row_indices, positions = numpy.nonzero(is_tied_top)
+        if len(row_indices):
+            self.__queue_priorities[rows[row_indices], order[row_indices, positions]] = \
+                heights[row_indices, positions] * self.__SEQ_RANGE - self.__queue_seq
+
+    def __dequeue(self, rows: numpy.ndarray) -> None:
+        """removes the top entry of every row: the last entry of the row takes its place, and the new top is found"""
+        if not len(rows):
+            return
+        tops = self.__queue_tops[rows]
+        lasts = self.__queue_sizes[rows] - 1
+        self.__queue_priorities[rows, tops] = self.__queue_priorities[rows, lasts]
+        self.__queue_slots[rows, tops] = self.__queue_slots[rows, lasts]
+        self.__queue_priorities[rows, lasts] = -1
+        self.__queue_sizes[rows] = lasts
+        width = max(int(lasts.max()), 1)
+        self.__queue_tops[rows] = self.__queue_priorities[rows,
+                                                          :width].argmax(axis=1)
+
+    def __take_partial(self, rows: numpy.ndarray, slots: numpy.ndarray) -> numpy.ndarray:
+        """the fraction of each block that was downloaded before (0 if it is not cached). Cached blocks become the most recently used."""
+        fractions = numpy.zeros(len(rows))
+        has_partial = numpy.flatnonzero(self.__partial_counts[rows] > 0)
+        rows, slots = rows[has_partial], slots[has_partial]
+        matches = (self.__partial_slots[rows] == slots[:, None]) & (
+            self.__partial_stamps[rows] > 0)
+        is_cached = matches.any(axis=1)
+        columns = matches.argmax(axis=1)
+        fractions[has_partial[is_cached]] = self.__partial_fractions[rows[is_cached], columns[is_cached]]
+        self.__touch_partial(rows[is_cached], columns[is_cached])
+        return fractions
+
+    def __store_partial(self, rows: numpy.ndarray, slots: numpy.ndarray, fractions: numpy.ndarray) -> None:
+        """caches the fractions, replacing the entry of the same block, or else an empty or the least recently used one"""
+        matches = (self.__partial_slots[rows] == slots[:, None]) & (
+            self.__partial_stamps[rows] > 0)
+        columns = numpy.where(matches.any(axis=1), matches.argmax(
+            axis=1), self.__partial_stamps[rows].argmin(axis=1))
+        self.__partial_counts[rows] += self.__partial_stamps[rows, columns] == 0
+        self.__partial_slots[rows, columns] = slots
+        self.__partial_fractions[rows, columns] = fractions
+        self.__touch_partial(rows, columns)
+
+    def __drop_partial(self, rows: numpy.ndarray, slots: numpy.ndarray) -> None:
+        has_partial = self.__partial_counts[rows] > 0
+        rows, slots = rows[has_partial], slots[has_partial]
+        matches = (self.__partial_slots[rows] == slots[:, None]) & (
+            self.__partial_stamps[rows] > 0)
+        match_rows, columns = numpy.nonzero(matches)
+        self.__partial_stamps[rows[match_rows], columns] = 0
+        self.__partial_counts[rows[match_rows]] -= 1
+
+    def __touch_partial(self, rows: numpy.ndarray, columns: numpy.ndarray) -> None:
+        # (a node appears at most once in rows, so the order of the stamps within a call does not matter)
+        self.__partial_stamp += 1
+        self.__partial_stamps[rows, columns] = self.__partial_stamp
+
+    def __slot_of(self, block: Block) -> int:
+        """the slot of the block, or -1 if its column was dropped"""
+        slot = int(numpy.searchsorted(
+            self.__block_ids[:self.__num_slots], block.id))
+        if slot < self.__num_slots and self.__block_ids[slot] == block.id:
+            return slot
+        return -1
+
+    def __add_slot(self, block: Block) -> int:
+        if self.__num_slots == len(self.__block_ids):
+            self.__grow()
+        slot = self.__num_slots
+        self.__num_slots += 1
+        self.__blocks.append(block)
+        self.__block_ids[slot] = block.id
+        self.__heights[slot] = block.height
+        self.__parents[slot] = -1 if block.parent is None else self.__slot_of(
+            block.parent)
+        self.__skips[slot] = -1 if block.skip is None else self.__slot_of(
+            block.skip)
+        return slot
+
+    def __grow(self) -> None:
+        capacity = 2 * len(self.__block_ids)
+        self.__block_ids = _resized(self.__block_ids, capacity, 0)
+        self.__heights = _resized(self.__heights, capacity, 0)
+        self.__parents = _resized(self.__parents, capacity, -1)
+        self.__skips = _resized(self.__skips, capacity, -1)
+        downloaded = numpy.zeros(
+            (len(self.__members), capacity), dtype=bool)
+        downloaded[:, :self.__num_slots] = self.__downloaded[:,
+                                                             :self.__num_slots]
+        self.__downloaded = downloaded
+
+    def __compact(self, keep: numpy.ndarray) -> None:
+        """keeps the given slots (in order) and renumbers every reference to a slot. References to dropped slots become -1"""
+        num_kept = int(keep.sum())
+        new_slots = numpy.where(keep, numpy.cumsum(keep) - 1, -1)
+
+        def renumber(slots: numpy.ndarray) -> numpy.ndarray:
+            return numpy.where(slots >= 0, new_slots[numpy.maximum(slots, 0)], -1)
+
+        kept = numpy.flatnonzero(keep)
+        self.__blocks = [self.__blocks[slot] for slot in kept]
+        self.__block_ids[:num_kept] = self.__block_ids[kept]
+        self.__heights[:num_kept] = self.__heights[kept]
+        self.__parents[:num_kept] = renumber(self.__parents[kept])
+        self.__skips[:num_kept] = renumber(self.__skips[kept])
+        self.__downloaded[:, :num_kept] = self.__downloaded[:, kept]
+        self.__downloaded[:, num_kept:self.__num_slots] = False
+        self.__num_slots = num_kept
+
+        self.__mining_targets = renumber(self.__mining_targets)
+        self.__download_targets = renumber(self.__download_targets)
+        self.__queue_slots = renumber(self.__queue_slots)
+        self.__partial_slots = renumber(self.__partial_slots)
+
+
+class PopulationNode:
+    """A single node of a population, with the interface that the mining oracle and the experiment use"""
+    __slots__ = ("__population", "__index", "__id", "__hash")
+
+    def __init__(self, population: NodePopulation, index: int, node_id: int) -> None:
+        self.__population = population
+        self.__index = index
+        self.__id = node_id
+        self.__hash = hash(node_id)
+
+    @property
+    def id(self) -> int:
+        return self.__id
+
+    @property
+    def mining_rate(self) -> float:
+        return self.__population.mining_rate
+
+    @property
+    def mining_target(self) -> Block:
+        return self.__population.mining_target(self.__index)
+
+    def mine_block(self) -> Block:
+        return self.__population.mine_block(self.__index)
+
+    def retained_blocks(self) -> List[Block]:
+        return [self.mining_target]
+
+    def release_final_blocks(self, blocks: List[Block]) -> None:
+        # the population drops the columns of all final blocks at once:
+        self.__population.release_final_blocks()
+
+    def __hash__(self) -> int:
+        return self.__hash
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}_{self.__id}"
+
+
+def _skip_heights(heights: numpy.ndarray) -> numpy.ndarray:
+    """block._skip_height of every height"""
+    def clear_lowest_bit(n: numpy.ndarray) -> numpy.ndarray:
+        return n & (n - 1)
+    odd = clear_lowest_bit(clear_lowest_bit(heights - 1)) + 1
+    even = clear_lowest_bit(heights)
+    return numpy.where(heights < 2, 0, numpy.where(heights & 1, odd, even))
+
+
+def _resized(array: numpy.ndarray, size: int, fill: int) -> numpy.ndarray:
+    resized = numpy.full(size, fill, dtype=array.dtype)
+    resized[:len(array)] = array
+    return resized
@@ -0,0 +1,236 @@
+from typing import Any, Dict, List, Optional, Tuple
+import dataclasses
+import multiprocessing
+import multiprocessing.connection
+import numpy
+
+from .block import Block, common_ancestor
+from .configuration import RunConfig, EventEngines
+from .context import SimulationContext
+from .engine import HeapEngine
+from .experiment import check_mining_schedule, mining_rates
+from .mining_schedule import MiningSchedule, generate_mining_schedule
+from .node_population import NodePopulation, check_population_config
+
+# (global index, global index of the parent) of a block. Blocks are indexed in the order in which they are mined, the genesis is 0:
+MinedBlock = Tuple[int, int]
+
+
+def check_parallel_config(run_config: RunConfig) -> None:
+    """a parallel run simulates a node population (see check_population_config) with the heap engine, whose
+    events can be scheduled at exact times, and with a positive header delay, which is the length of its windows."""
+    check_population_config(run_config)
+    unsupported = []
+    if run_config.engine != EventEngines.Heap.value:
+        unsupported.append(f"the {run_config.engine} engine")
+    if run_config.header_delay <= 0:
+        unsupported.append("a header delay of 0")
+    if run_config.log_blocks or run_config.verbose:
+        unsupported.append("block and event logs")
+    if unsupported:
+        raise ValueError(
+            f"A parallel run does not support {', '.join(unsupported)}")
+
+
+def run_parallel(run_config: RunConfig) -> Dict[str, Any]:
+    """runs the honest nodes of the configuration in run_config.parallel_workers processes, each simulating a partition of them
+    as a node population, and returns the results of Experiment.get_results (the same results, for the same seed).
+
+    This is a conservative parallel simulation: no node hears of a block before the header delay has passed since it was mined,
+    so the partitions advance in windows as long as the header delay. The blocks that a partition mines in a window are sent
+    to all others at the end of the window, and their headers arrive in a later window, exactly when they would in a single process.
+    The miners and times of all blocks are drawn up front from the seed (see generate_mining_schedule), so only the parents of the blocks
+    are exchanged. Honest blocks are always available, so availability never changes."""
+    check_parallel_config(run_config)
+    # without a seed, fresh entropy is drawn once, shared by all partitions and reported in the results
+    # (an int, as in SimulationContext.seed):
+    seed: int = numpy.random.SeedSequence(run_config.seed).entropy  # type: ignore
+    if run_config.mining_schedule:
+        schedule = MiningSchedule.load(run_config.mining_schedule)
+        check_mining_schedule(schedule, run_config)
+    else:
+        schedule = generate_mining_schedule(
+            mining_rates(run_config), run_config.run_time, seed)
+
+    num_workers = max(1, min(run_config.parallel_workers,
+                             run_config.num_honest))
+    bounds = numpy.linspace(0, run_config.num_honest,
+                            num_workers + 1).astype(int).tolist()
+    # the global block tree, by global index:
+    parents = [-1]
+    heights = [0]
+
+    connections: List[multiprocessing.connection.Connection] = []
+    processes: List[multiprocessing.Process] = []
+    try:
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_run_partition, daemon=True,
+                                              args=(worker_connection, run_config, seed, first, last,
+                                                    schedule.block_times, schedule.miners))
+            process.start()
+            connections.append(connection)
+            processes.append(process)
+
+        time = 0.0
+        next_prune = run_config.prune_interval if run_config.prune_interval > 0 else numpy.inf
+        mined: List[MinedBlock] = []
+        watermark: Optional[int] = None
+        while time < run_config.run_time:
+            time = min(time + run_config.header_delay, run_config.run_time)
+            report_watermark = time >= next_prune
+            while next_prune <= time:
+                next_prune += run_config.prune_interval
+            for connection in connections:
+                connection.send((time, mined, watermark, report_watermark))
+            replies = [_receive(connection) for connection in connections]
+
+            # the blocks mined before the end of the window are the next ones in the global order:
+            mined = sorted(block for blocks, _ in replies for block in blocks)
+            for index, parent in mined:
+                assert index == len(parents)
+                parents.append(parent)
+                heights.append(heights[parent] + 1)
+            watermark = None
+            if report_watermark:
+                watermark = _common_ancestor(
+                    [local_watermark for _, local_watermark in replies], parents, heights)
+
+        for connection in connections:
+            connection.send(None)
+        mining_targets = [target for connection in connections
+                          for target in _receive(connection)]
+    finally:
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    result: Dict[str, Any] = {}
+    result["config"] = dataclasses.asdict(run_config)
+    result["seed"] = seed
+    result["honest_chain_height"] = max(heights[target]
+                                        for target in mining_targets)
+    result["honest_chain_common_ancestor_height"] = heights[_common_ancestor(
+        mining_targets, parents, heights)]
+    return result
+
+
+def _receive(connection: multiprocessing.connection.Connection) -> Any:
+    reply = connection.recv()
+    if isinstance(reply, Exception):
+        raise RuntimeError("a partition of the parallel run failed") from reply
+    return reply
+
+
+def _common_ancestor(blocks: List[int], parents: List[int], heights: List[int]) -> int:
+    """the common ancestor of blocks given by global index: the highest ones step back until they all meet"""
+    current = set(blocks)
+    while len(current) > 1:
+        highest = max(current, key=lambda block: heights[block])
+        current.remove(highest)
+        current.add(parents[highest])
+    return current.pop()
+
+
+def _run_partition(connection: multiprocessing.connection.Connection, run_config: RunConfig, seed: int, first: int, last: int,
+                   block_times: numpy.ndarray, miners: numpy.ndarray) -> None:
+    """the loop of a worker process: advances its partition window by window, until it is asked for the final mining targets"""
+    try:
+        partition = _Partition(run_config, seed, first,
+                               last, block_times, miners)
+        while True:
+            message = connection.recv()
+            if message is None:
+                connection.send(partition.mining_targets())
+                return
+            connection.send(partition.advance(*message))
+    except Exception as e:
+        connection.send(e)
+        raise
+
+
+class _Partition:
+    """the honest nodes first..last-1 of a parallel run, simulated as a node population with its own copy of the block tree.
+    Blocks have ids of their own in every partition, so they are exchanged by their global index."""
+
+    def __init__(self, run_config: RunConfig, seed: int, first: int, last: int,
+                 block_times: numpy.ndarray, miners: numpy.ndarray) -> None:
+        self.__env = HeapEngine()
+        self.__context = SimulationContext(self.__env, seed)
+        genesis = Block(None, None, 0, self.__context)
+        self.__population = NodePopulation(genesis, last - first, run_config.honest_block_rate, run_config.bandwidth,
+                                           run_config.header_delay, self.__context,
+                                           merge_classes=run_config.symmetry_reduction)
+        self.__first = first
+        self.__block_times = block_times
+        self.__miners = miners
+
+        # the blocks that are not final by global index, and the global index of every block by (dense) id:
+        self.__blocks: Dict[int, Block] = {0: genesis}
+        self.__global_index: List[int] = [0]
+        self.__mined: List[MinedBlock] = []
+
+        # the global indices of the blocks of this partition, in reverse order (block i of the schedule has global index i + 1):
+        own = numpy.flatnonzero((miners >= first) & (miners < last) &
+                                (block_times < run_config.run_time)) + 1
+        self.__own_blocks = own[::-1].tolist()
+        self.__schedule_next_block()
+
+    def __schedule_next_block(self) -> None:
+        if not self.__own_blocks:
+            return
+        index = self.__own_blocks.pop()
+
+        def mine() -> None:
+            block = self.__population.mine_block(
+                int(self.__miners[index - 1]) - self.__first)
+            self.__add(index, block)
+            assert block.parent is not None
+            self.__mined.append(
+                (index, self.__global_index[block.parent.id]))
+            self.__schedule_next_block()
+        self.__env.schedule_at(float(self.__block_times[index - 1]), mine)
+
+    def __add(self, index: int, block: Block) -> None:
+        assert block.id == len(self.__global_index)
+        self.__blocks[index] = block
+        self.__global_index.append(index)
+
+    def advance(self, until: float, mined: List[MinedBlock], watermark: Optional[int],
+                report_watermark: bool) -> Tuple[List[MinedBlock], Optional[int]]:
+        """receives the blocks that the other partitions mined in the last window and prunes below the given watermark,
+        then simulates until the end of the next window. Returns the blocks mined in it, and the common ancestor of the
+        mining targets of this partition if asked to report it."""
+        for index, parent in mined:
+            if index in self.__blocks:
+                continue
+            block = Block(None, self.__blocks[parent], float(
+                self.__block_times[index - 1]), self.__context)
+            self.__add(index, block)
+            self.__population.receive_block(block)
+
+        # (no node builds on a final block, and a watermark below the current one is ignored)
+        watermark_block = self.__blocks.get(
+            watermark) if watermark is not None else None
+        if watermark_block is not None:
+            self.__context.prune(watermark_block)
+            self.__population.release_final_blocks()
+            self.__blocks = {index: block for index,
+                             block in self.__blocks.items() if not block.is_final}
+
+        self.__env.run(until=until)
+
+        blocks, self.__mined = self.__mined, []
+        local_watermark = None
+        if report_watermark:
+            targets = list({node.mining_target.id: node.mining_target
+                            for node in self.__population.members}.values())
+            local_block = targets[0]
+            for block in targets:
+                local_block = common_ancestor(local_block, block)
+            local_watermark = self.__global_index[local_block.id]
+        return blocks, local_watermark
+
+    def mining_targets(self) -> List[int]:
+        return [self.__global_index[node.mining_target.id] for node in self.__population.members]
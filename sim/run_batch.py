@@ -0,0 +1,125 @@
+from typing import Any, Dict, Iterator, List, Optional
+
+import argparse
+import dataclasses
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import numpy
+import tqdm
+
+from .configuration import RunConfig
+from .experiment import Experiment
+from .parallel import run_parallel
+
+
+def setup_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='run_batch',
+        description='Run many simulations in a pool of worker processes.\nEach line of the input file is a json object with the fields of a RunConfig.')
+
+    parser.add_argument("configs", type=str,
+                        help="a jsonl file with one run configuration per line")
+
+    parser.add_argument("--workers", default=os.cpu_count(), type=int,
+                        help="number of worker processes (defaults to the number of cpus, 1 runs everything in this process)")
+
+    parser.add_argument("--seed", default=None, type=int,
+                        help="base seed from which a seed is spawned for every run that does not set its own")
+
+    parser.add_argument("--out", default="", type=str,
+                        help="filename (where to write the results, one json line per finished run. defaults to stdout)")
+    return parser
+
+
+def parse_run_config(line: str) -> RunConfig:
+    fields = {field.name for field in dataclasses.fields(RunConfig)}
+    values = json.loads(line)
+    unknown = set(values) - fields
+    if unknown:
+        raise ValueError(f"Unknown run configuration fields: {sorted(unknown)}")
+    if values.get(RunConfig.VERBOSE):
+        # (the events of all runs would be interleaved, on the stdout that the results may go to)
+        raise ValueError("verbose is not supported in a batch")
+    return RunConfig(**values)
+
+
+def read_run_configs(file_name: str) -> List[RunConfig]:
+    with open(file_name, 'r') as in_file:
+        return [parse_run_config(line) for line in in_file if line.strip()]
+
+
+def run_single(run_cfg: RunConfig) -> Dict[str, Any]:
+    """runs a single experiment and returns its results.
+    Failures are reported in the result rather than raised, so one bad configuration does not stop the batch."""
+    handler = None
+    if run_cfg.log_blocks:
+        logger = logging.getLogger("BLOCK_LOG")
+        logger.setLevel(logging.INFO)
+        handler = logging.FileHandler(run_cfg.log_blocks, mode='w')
+        handler.setLevel(logging.INFO)
+        logger.addHandler(handler)
+
+    try:
+        if run_cfg.parallel_workers > 1:
+            result = run_parallel(run_cfg)
+        else:
+            experiment = Experiment(run_cfg)
+            experiment.run_experiment(progress_bar=False)
+            result = experiment.get_results()
+    except Exception as e:
+        return {"config": dataclasses.asdict(run_cfg), "error": repr(e)}
+    finally:
+        if handler is not None:
+            logging.getLogger("BLOCK_LOG").removeHandler(handler)
+            handler.close()
+
+    if run_cfg.save_results:
+        with open(run_cfg.save_results, 'w') as out_file:
+            json.dump(result, out_file, indent=2)
+    return result
+
+
+def assign_seeds(run_configs: List[RunConfig], seed: Optional[int]) -> None:
+    """gives every run without a seed its own seed, spawned from the base seed. 
+    Seeds are tied to runs (not to workers), so the results do not depend on how runs are scheduled."""
+    children = numpy.random.SeedSequence(seed).spawn(len(run_configs))
+    for run_cfg, child in zip(run_configs, children):
+        if run_cfg.seed is None:
+            run_cfg.seed = int(child.generate_state(1, numpy.uint64)[0])
+
+
+def run_batch(run_configs: List[RunConfig], workers: int) -> Iterator[Dict[str, Any]]:
+    """runs all configurations and yields their results in order of completion.
+    Runs with parallel_workers start processes of their own, which the workers of a pool cannot, so they run first, in this process."""
+    for run_cfg in run_configs:
+        if run_cfg.parallel_workers > 1:
+            yield run_single(run_cfg)
+    run_configs = [run_cfg for run_cfg in run_configs if run_cfg.parallel_workers <= 1]
+    if workers <= 1:
+        for run_cfg in run_configs:
+            yield run_single(run_cfg)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(run_single, run_configs)
+
+
+if __name__ == "__main__":
+    parser = setup_parser()
+    args = parser.parse_args()
+
+    run_configs = read_run_configs(args.configs)
+    assign_seeds(run_configs, args.seed)
+
+    out_file = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        for result in tqdm.tqdm(run_batch(run_configs, args.workers), total=len(run_configs), disable=None):
+            out_file.write(json.dumps(result) + "\n")
+            out_file.flush()
+    finally:
+        if out_file is not sys.stdout:
+            out_file.close()
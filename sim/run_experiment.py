@@ -5,8 +5,9 @@ import logging
 import sys
 import json
 
-from .configuration import RunConfig, DownloadRules
+from .configuration import RunConfig, DownloadRules, EventEngines
 from .experiment import Experiment
+from .parallel import run_parallel
 
 
 class MyParser(argparse.ArgumentParser):
@@ -30,6 +31,9 @@ def setup_parser() -> argparse.ArgumentParser:
     parser.add_argument('--' + RunConfig.INDUCE_SPLIT, nargs=2, type=float, metavar=('START', 'END'),
                         help="split the network from <START> to <END> times")
 
+    parser.add_argument('--' + RunConfig.PARTITION_SCHEDULE, default="", type=str,
+                        help="filename (a json list of [time, partition] entries that split and heal the network, see the README)")
+
     parser.add_argument("--" + RunConfig.MODE, choices=[
                         'pos', 'pow'], help="which mode of operation we are using (currently ineffective, always use pow!)", required=True)
 
@@ -63,6 +67,27 @@ def setup_parser() -> argparse.ArgumentParser:
     parser.add_argument("--" + RunConfig.DOWNLOAD_RULE, default=DownloadRules.LongestHeaderChain.value, choices=[rule.value for rule in DownloadRules], required=False, type=str,
                         help="The download rule to use")
 
+    parser.add_argument("--" + RunConfig.SEED, default=None, required=False, type=int,
+                        help="seed of the random number generators (defaults to fresh entropy, which is reported in the results)")
+
+    parser.add_argument("--" + RunConfig.PRUNE_INTERVAL, metavar="SECs", default=0, required=False, type=float,
+                        help="release the block tree below the common ancestor of all nodes every SECs of simulated time (defaults to 0, no pruning). Cannot be used with --plot")
+
+    parser.add_argument("--" + RunConfig.MINING_SCHEDULE, default="", required=False, type=str,
+                        help="filename (a pre-generated mining schedule to use instead of sampling blocks during the run, see sim.mining_schedule)")
+
+    parser.add_argument("--" + RunConfig.ENGINE, default=EventEngines.Simpy.value, choices=[engine.value for engine in EventEngines], required=False, type=str,
+                        help="The discrete event engine that drives the simulation")
+
+    parser.add_argument("--" + RunConfig.NODE_POPULATION, action='store_true',
+                        help="simulate the honest nodes as one array-backed population (honest longest header chain nodes only, see sim.node_population)")
+
+    parser.add_argument("--" + RunConfig.SYMMETRY_REDUCTION, action='store_true',
+                        help="simulate honest nodes that hold the same view once (a node population that merges identical nodes into classes)")
+
+    parser.add_argument("--" + RunConfig.PARALLEL_WORKERS, metavar="WORKERS", default=0, required=False, type=int,
+                        help="split the honest nodes of a population between WORKERS processes that advance in windows of the header delay (see sim.parallel)")
+
     parser.add_argument("--" + RunConfig.NUM_HONEST, default=10, required=True, type=int,
                         help="number of honest nodes")
 
@@ -78,6 +103,10 @@ def setup_parser() -> argparse.ArgumentParser:
     parser.add_argument("--" + RunConfig.HEADER_DELAY, default=0, required=True, type=float,
                         help="header_delay header delay of each honest node")
 
+    parser.add_argument("--" + RunConfig.TOPOLOGY, default="", required=False, type=str,
+                        help="links between the nodes: random_regular:DEGREE, small_world:DEGREE:REWIRING or the filename of an edge list. "
+                        "Headers travel along the shortest paths, and the header delay is the delay of every link (defaults to a complete graph)")
+
     parser.add_argument('--' + RunConfig.SAVE_RESULTS, default="", type=str,
                         help="filename (Where to save the results of the simulation)")
 
@@ -107,10 +136,13 @@ if __name__ == "__main__":
         handler2.setLevel(logging.INFO)
         logger.addHandler(handler2)
 
-    experiment = Experiment(run_cfg)
-    experiment.run_experiment()
+    if run_cfg.parallel_workers > 1:
+        result = run_parallel(run_cfg)
+    else:
+        experiment = Experiment(run_cfg)
+        experiment.run_experiment()
 
-    result = experiment.get_results()
+        result = experiment.get_results()
 
     # write the results to stdout or file:
     if run_cfg.save_results:
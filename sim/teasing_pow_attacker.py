@@ -2,7 +2,7 @@
 from .block import Block
 from .node import Node
 import sim.network as network
-from typing import Optional
+from typing import Optional, List
 
 
 class TeasingPoWAttacker(Node):
@@ -10,6 +10,8 @@ class TeasingPoWAttacker(Node):
     it always releases 2 headers ahead but allows download only one header ahead
     thus, a node that downloads towards the longest tip always first downloads the matching block of this attacker."""
 
+    _withholds_blocks = True
+
     def __init__(self, genesis: Block, mining_rate: float, network: network.Network) -> None:
         super().__init__(genesis, mining_rate, bandwidth=0, header_delay=0, network=network)
 
@@ -26,7 +28,6 @@ class TeasingPoWAttacker(Node):
 
     def mine_block(self) -> Block:
         block = super().mine_block()
-        block.is_available = False
 
         if block.parent == self._last_available:
             self._next_available = block
@@ -54,20 +55,11 @@ class TeasingPoWAttacker(Node):
 
         self._mining_target = self._tip
 
-        
+
         # A block is not safe to make available if any one of the chains that extend it is already fully available (perhaps mined by an SPV node) and is longer than the honest chain. Such a block is not safe to make available because it would cause honest nodes to download a chain that is longer than the honest chain, and thus the attack would fail.
+        # (the blocks below the next block to release that are reachable through available blocks are tracked by the block tree)
         def safe_to_make_available(candidate: Block) -> bool:
-            stack = [candidate]
-            while stack:
-                current_block = stack.pop()
-                children = current_block.get_children()
-                for child in children:
-                    if child.is_available:
-                        if child.height >= block.height:
-                            return False
-                        else:
-                            stack.append(child)
-            return True
+            return candidate.available_descendant_height < block.height
 
         # make blocks available up to the height of the honest chain:
         while block.height-1 > self._last_available.height:
@@ -86,6 +78,11 @@ class TeasingPoWAttacker(Node):
         if self._next_available and self._next_available.get_children():
             self._broadcast_header(next((child for child in self._next_available.get_children() if not child.is_available), None))
 
+    def retained_blocks(self) -> List[Block]:
+        candidates = [self._mining_target, self._tip, self._last_available,
+                      self._next_available, self._spv_tip]
+        return [block for block in candidates if block is not None]
+
     def download_complete(self, block: Block) -> None:
         super().download_complete(block)
         self._mining_target = self._tip
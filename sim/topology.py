@@ -0,0 +1,215 @@
+from typing import Callable, Dict, List, Set, Tuple, Union
+import numpy
+import numpy.random
+
+
+class Topology:
+    """The links between the nodes of a network (nodes are numbered in the order they connect to it), and the end-to-end
+    header delays between every two nodes: the shortest path in link delays. A header is relayed along the shortest path
+    without simulating the hops, so a broadcast is one event per distinct delay from its sender.
+
+    The delays are computed once, for all pairs. Paths add up the same few link delays, so the matrix holds a code of every delay
+    into a table of the distinct delays, a byte per pair as long as there are at most 256 of them: the delays of 10000 nodes
+    take 100MB (200MB with more distinct delays)."""
+
+    # the gathered rows of a chunk of sources are kept below this many entries while the delays are computed:
+    __CHUNK_ENTRIES = 1 << 23
+
+    def __init__(self, num_nodes: int, edges: numpy.ndarray, link_delays: Union[float, numpy.ndarray]) -> None:
+        edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+        delays = numpy.broadcast_to(numpy.asarray(
+            link_delays, dtype=numpy.float64), (len(edges),))
+        if len(edges) and (edges.min() < 0 or edges.max() >= num_nodes):
+            raise ValueError(
+                f"the links must be between nodes 0..{num_nodes - 1}")
+        if (delays < 0).any():
+            raise ValueError("link delays cannot be negative")
+        self.__num_nodes = num_nodes
+        self.__edges = edges
+        self.__link_delays = delays
+        self.__delay_values, self.__delay_codes = self.__compute_delays()
+        if numpy.isinf(self.__delay_values).any():
+            raise ValueError(
+                "the topology is not connected, some headers would never arrive")
+
+    @property
+    def num_nodes(self) -> int:
+        return self.__num_nodes
+
+    @property
+    def num_links(self) -> int:
+        return len(self.__edges)
+
+    def delay(self, sender: int, recipient: int) -> float:
+        return float(self.__delay_values[self.__delay_codes[sender, recipient]])
+
+    def recipients_by_delay(self, sender: int) -> List[Tuple[float, numpy.ndarray]]:
+        """the other nodes grouped by their delay from the sender (in order of delay), in their original order within each group"""
+        codes = self.__delay_codes[sender]
+        order = numpy.argsort(codes, kind="stable")
+        order = order[order != sender]
+        group_codes, group_starts = numpy.unique(
+            codes[order], return_index=True)
+        return [(float(self.__delay_values[code]), nodes)
+                for code, nodes in zip(group_codes, numpy.split(order, group_starts[1:]))]
+
+    def __compute_delays(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """all pairs shortest paths: the delays from a chunk of sources are relaxed over the links into every node at once
+        (Bellman-Ford), until they stop changing. Each chunk is encoded right away, so only the codes are kept for all pairs,
+        in bytes as long as there are at most 256 distinct delays."""
+        num_nodes = self.__num_nodes
+        # the links into every node, padded with a link from the node itself (of delay 0, which keeps the current delay):
+        links_in: List[List[Tuple[int, float]]] = [
+            [(node, 0.0)] for node in range(num_nodes)]
+        for (u, v), link_delay in zip(self.__edges.tolist(), self.__link_delays.tolist()):
+            links_in[v].append((u, link_delay))
+            links_in[u].append((v, link_delay))
+        width = max(len(links) for links in links_in)
+        neighbours = numpy.repeat(numpy.arange(num_nodes)[
+                                  :, None], width, axis=1)
+        weights = numpy.zeros((num_nodes, width))
+        for node, links in enumerate(links_in):
+            neighbours[node, :len(links)] = [u for u, _ in links]
+            weights[node, :len(links)] = [delay for _, delay in links]
+
+        values = numpy.zeros(0)
+        codes = numpy.empty((num_nodes, num_nodes), dtype=numpy.uint8)
+        chunk_size = max(1, self.__CHUNK_ENTRIES // (num_nodes * width))
+        for start in range(0, num_nodes, chunk_size):
+            sources = numpy.arange(start, min(start + chunk_size, num_nodes))
+            delays = numpy.full((len(sources), num_nodes), numpy.inf)
+            delays[numpy.arange(len(sources)), sources] = 0
+            while True:
+                relaxed = (delays[:, neighbours] + weights).min(axis=2)
+                if numpy.array_equal(relaxed, delays):
+                    break
+                delays = relaxed
+
+            # the table of distinct delays only grows, so the codes of earlier chunks stay valid:
+            distinct = numpy.unique(delays)
+            values = numpy.concatenate(
+                [values, numpy.setdiff1d(distinct, values, assume_unique=True)])
+            order = numpy.argsort(values)
+            if len(values) - 1 > numpy.iinfo(codes.dtype).max:
+                # (the codes are widened only when the table outgrows them, so they stay as small as they can be)
+                codes = codes.astype(numpy.min_scalar_type(len(values) - 1))
+            codes[sources] = order[numpy.searchsorted(
+                values[order], delays)]
+        return values, codes
+
+    @staticmethod
+    def random_regular(num_nodes: int, degree: int, link_delay: float, rng: numpy.random.Generator) -> "Topology":
+        """a random graph in which every node has the given number of links. A dense graph is the complement of a random sparse one
+        (of degree num_nodes - 1 - degree), so the links are always drawn for a degree of at most half the nodes (see _random_regular_links)."""
+        if degree < 0 or degree >= num_nodes or (num_nodes * degree) % 2:
+            raise ValueError(
+                f"there is no {degree}-regular graph on {num_nodes} nodes")
+        if 2 * degree <= num_nodes - 1:
+            return Topology(num_nodes, numpy.array(_random_regular_links(num_nodes, degree, rng)), link_delay)
+        missing = {_link(u, v) for u, v in _random_regular_links(
+            num_nodes, num_nodes - 1 - degree, rng)}
+        edges = [[u, v] for u in range(num_nodes) for v in range(u + 1, num_nodes)
+                 if (u, v) not in missing]
+        return Topology(num_nodes, numpy.array(edges), link_delay)
+
+    @staticmethod
+    def small_world(num_nodes: int, degree: int, rewiring: float, link_delay: float,
+                    rng: numpy.random.Generator) -> "Topology":
+        """a Watts-Strogatz graph: a ring in which every node links to its degree/2 nearest nodes on each side,
+        after which every link is rewired to a random node with the given probability"""
+        if degree % 2 or degree >= num_nodes:
+            raise ValueError(
+                f"a small world on {num_nodes} nodes needs an even degree below {num_nodes}")
+        neighbours: Dict[int, Set[int]] = {
+            node: set() for node in range(num_nodes)}
+        edges = []
+        for offset in range(1, degree // 2 + 1):
+            for node in range(num_nodes):
+                edges.append([node, (node + offset) % num_nodes])
+        for u, v in edges:
+            neighbours[u].add(v)
+            neighbours[v].add(u)
+        for edge in edges:
+            u, v = edge
+            if rng.random() >= rewiring or len(neighbours[u]) >= num_nodes - 1:
+                continue
+            w = int(rng.integers(num_nodes))
+            while w == u or w in neighbours[u]:
+                w = int(rng.integers(num_nodes))
+            neighbours[u].remove(v)
+            neighbours[v].remove(u)
+            neighbours[u].add(w)
+            neighbours[w].add(u)
+            edge[1] = w
+        return Topology(num_nodes, numpy.array(edges), link_delay)
+
+    @staticmethod
+    def load(file_name: str, num_nodes: int, link_delay: float) -> "Topology":
+        """reads an edge list: a line "u v" links nodes u and v with the given link delay, and "u v delay" with a delay of its own.
+        Blank lines and lines starting with # are skipped."""
+        edges = []
+        link_delays = []
+        with open(file_name, 'r') as in_file:
+            for line in in_file:
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                if len(fields) not in (2, 3):
+                    raise ValueError(f"not an edge: {line.strip()}")
+                edges.append([int(fields[0]), int(fields[1])])
+                link_delays.append(
+                    float(fields[2]) if len(fields) == 3 else link_delay)
+        return Topology(num_nodes, numpy.array(edges), numpy.array(link_delays))
+
+
+def _link(u: int, v: int) -> Tuple[int, int]:
+    return (u, v) if u < v else (v, u)
+
+
+def _random_regular_links(num_nodes: int, degree: int, rng: numpy.random.Generator) -> List[List[int]]:
+    """the links of a random regular graph: stubs are paired at random, and self loops and parallel links are then removed
+    by swapping their ends with those of random links. Some pairings cannot be repaired by swaps, so after a bounded number of
+    failed swaps the pairing is drawn again."""
+    max_attempts = 100 * (num_nodes * degree // 2) + 1000
+    while True:
+        stubs = numpy.repeat(numpy.arange(num_nodes), degree)
+        rng.shuffle(stubs)
+        edges = stubs.reshape(-1, 2).tolist()
+
+        seen: Set[Tuple[int, int]] = set()
+        bad = []
+        for index, (u, v) in enumerate(edges):
+            if u == v or _link(u, v) in seen:
+                bad.append(index)
+            else:
+                seen.add(_link(u, v))
+        attempts = 0
+        while bad and attempts < max_attempts:
+            attempts += 1
+            index = bad[-1]
+            a, b = edges[index]
+            other = int(rng.integers(len(edges)))
+            c, d = edges[other]
+            # swap ends: (a, b), (c, d) -> (a, c), (b, d), if neither is a self loop or an existing link:
+            if other in bad or a == c or b == d or _link(a, c) in seen or _link(b, d) in seen or _link(a, c) == _link(b, d):
+                continue
+            bad.pop()
+            seen.remove(_link(c, d))
+            edges[index], edges[other] = [a, c], [b, d]
+            seen.add(_link(a, c))
+            seen.add(_link(b, d))
+        if not bad:
+            return edges
+
+
+def create_topology(spec: str, num_nodes: int, link_delay: float,
+                    spawn_rng: Callable[[], numpy.random.Generator]) -> Topology:
+    """a topology from its description: "random_regular:DEGREE", "small_world:DEGREE:REWIRING" or the file name of an edge list.
+    A generator is only spawned for the random graphs."""
+    kind, _, args = spec.partition(":")
+    if kind == "random_regular":
+        return Topology.random_regular(num_nodes, int(args), link_delay, spawn_rng())
+    if kind == "small_world":
+        degree, rewiring = args.split(":")
+        return Topology.small_world(num_nodes, int(degree), float(rewiring), link_delay, spawn_rng())
+    return Topology.load(spec, num_nodes, link_delay)
@@ -0,0 +1,46 @@
+from sim.block import Block, common_ancestor
+from sim.context import SimulationContext
+from sim.engine import HeapEngine
+
+
+def chain(parent: Block, length: int, context: SimulationContext) -> Block:
+    for _ in range(length):
+        parent = Block(None, parent, 0, context)
+    return parent
+
+
+def test_copies_are_not_linked_until_materialized() -> None:
+    context = SimulationContext(HeapEngine(), 0)
+    genesis = Block(None, None, 0, context)
+    base = chain(genesis, 3, context)
+    copies = Block.copy_chain(None, base, 10, 8, 1.0, context)
+
+    assert len(context.all_blocks) == 4
+    assert all(copy.id == -1 for copy in copies)
+    assert not base.get_children()
+    assert [copy.height for copy in copies] == list(range(4, 14))
+    assert [copy.is_available for copy in copies] == [True] * 8 + [False] * 2
+    assert copies[-1].ancestor(7) is copies[3]
+    assert copies[-1].ancestor(2) is genesis.get_children()[0].get_children()[0]
+    assert common_ancestor(copies[-1], base) is base
+
+    copies[5].materialize()
+    assert all(copy.is_materialized for copy in copies[:6])
+    assert not any(copy.is_materialized for copy in copies[6:])
+    assert context.all_blocks[4:] == copies[:6]
+    assert base.get_children() == [copies[0]]
+    assert [copy.id for copy in copies[:6]] == list(range(4, 10))
+    assert copies[5].label == "9.1" and copies[6].id == -1
+    assert copies[-1].ancestor(7) is copies[3]
+
+
+def test_building_on_a_copy_materializes_it() -> None:
+    context = SimulationContext(HeapEngine(), 0)
+    genesis = Block(None, None, 0, context)
+    copies = Block.copy_chain(None, genesis, 5, 3, 1.0, context)
+
+    block = Block(None, copies[2], 2.0, context)
+    assert all(copy.is_materialized for copy in copies[:3])
+    assert not copies[3].is_materialized
+    assert block.ancestor(1) is copies[0]
+    assert block.parent is copies[2] and copies[2].get_children() == [block]
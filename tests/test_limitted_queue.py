@@ -0,0 +1,47 @@
+import random
+from typing import List, Tuple
+
+from sim.limitted_queue import LimittedQueue
+
+
+class SortedListQueue:
+    """the queue as a sorted list, with the top last (the order LimittedQueue keeps)"""
+
+    def __init__(self, buffer_size: int) -> None:
+        self.queue: List[Tuple[int, int]] = []
+        self.buffer_size = buffer_size
+
+    def enqueue(self, item: int, priority: int) -> None:
+        rec = priority, item
+        if len(self.queue) >= self.buffer_size:
+            for ind in range(len(self.queue)-1, -1, -1):
+                if self.queue[ind][0] < rec[0]:
+                    rec, self.queue[ind] = self.queue[ind], rec
+        else:
+            self.queue.append(rec)
+            ind = len(self.queue)-2
+            while ind > -1 and self.queue[ind][0] >= self.queue[ind+1][0]:
+                self.queue[ind], self.queue[ind+1] = self.queue[ind+1], self.queue[ind]
+                ind -= 1
+
+    def dequeue(self) -> int:
+        return self.queue.pop()[1]
+
+
+def test_keeps_the_order_of_a_sorted_list() -> None:
+    rng = random.Random(0)
+    for _ in range(200):
+        buffer_size = rng.randint(1, 12)
+        queue: LimittedQueue[int, int] = LimittedQueue(buffer_size)
+        expected = SortedListQueue(buffer_size)
+        for item in range(300):
+            if len(queue) and rng.random() < 0.3:
+                assert queue.peek() == expected.queue[-1][1]
+                assert queue.dequeue() == expected.dequeue()
+            else:
+                priority = rng.randint(0, 6)
+                queue.enqueue(item, priority)
+                expected.enqueue(item, priority)
+            assert len(queue) == len(expected.queue)
+        assert [queue.dequeue() for _ in range(len(queue))] == \
+            [expected.dequeue() for _ in range(len(expected.queue))]
@@ -0,0 +1,31 @@
+import numpy
+import pytest
+
+from sim.topology import Topology
+
+
+def degrees(topology: Topology) -> numpy.ndarray:
+    return numpy.array([sum(topology.delay(u, v) == 1.0 for v in range(topology.num_nodes))
+                        for u in range(topology.num_nodes)])
+
+
+@pytest.mark.parametrize("num_nodes, degree", [(4, 3), (5, 4), (8, 6), (10, 9), (10, 3), (30, 4)])
+@pytest.mark.parametrize("seed", range(5))
+def test_random_regular(num_nodes: int, degree: int, seed: int) -> None:
+    topology = Topology.random_regular(
+        num_nodes, degree, 1.0, numpy.random.default_rng(seed))
+    assert topology.num_links == num_nodes * degree // 2
+    assert (degrees(topology) == degree).all()
+
+
+def test_random_regular_complete() -> None:
+    num_nodes = 12
+    topology = Topology.random_regular(
+        num_nodes, num_nodes - 1, 0.5, numpy.random.default_rng(0))
+    assert all(topology.delay(u, v) == 0.5 for u in range(num_nodes)
+               for v in range(num_nodes) if u != v)
+
+
+def test_no_regular_graph() -> None:
+    with pytest.raises(ValueError):
+        Topology.random_regular(5, 3, 1.0, numpy.random.default_rng(0))